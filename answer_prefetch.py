@@ -0,0 +1,83 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from database import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Once a fabric analysis is ready, answers to the most popular preset
+# questions are requested in the background. Each answer lands in the
+# response cache, so choosing that question afterwards returns at once.
+PREFETCH_ANSWERS = os.getenv("PREFETCH_FABRIC_ANSWERS", "0") == "1"
+PREFETCH_ANSWER_COUNT = int(os.getenv("PREFETCH_ANSWER_COUNT", "5"))
+PREFETCH_MAX_WORKERS = int(os.getenv("PREFETCH_MAX_WORKERS", "3"))  # concurrency cap across all sessions
+MAX_TRACKED_PREFETCHES = 256
+
+# Shared by every session so the cap holds process-wide
+_executor = ThreadPoolExecutor(max_workers=max(1, PREFETCH_MAX_WORKERS), thread_name_prefix="answer-prefetch")
+_prefetches = {}
+_prefetches_lock = threading.Lock()
+
+def record_question(question):
+    try:
+        with get_connection() as conn:
+            conn.execute('''INSERT INTO question_popularity (question, uses) VALUES (?, 1)
+                            ON CONFLICT(question) DO UPDATE SET uses = uses + 1''', (question,))
+    except sqlite3.Error as e:
+        logger.warning(f"Could not record question popularity: {e}")
+
+def popular_questions(questions, limit=PREFETCH_ANSWER_COUNT):
+    """The limit most asked of the given questions; ties and never-asked questions keep their listed order."""
+    try:
+        with get_connection() as conn:
+            uses = dict(conn.execute('SELECT question, uses FROM question_popularity').fetchall())
+    except sqlite3.Error as e:
+        logger.warning(f"Could not read question popularity: {e}")
+        uses = {}
+    ranked = sorted(range(len(questions)), key=lambda index: (-uses.get(questions[index], 0), index))
+    return [questions[index] for index in ranked[:limit]]
+
+def _prefetch_key(analysis, question):
+    return hashlib.sha256(f"{analysis}\n{question}".encode("utf-8")).hexdigest()
+
+def prefetch_answers(answer_fn, analysis, questions):
+    """Request answer_fn(question, analysis) for each question in the background, at most once per pair."""
+    with _prefetches_lock:
+        if len(_prefetches) > MAX_TRACKED_PREFETCHES:
+            # Finished answers are already in the response cache
+            for key in [key for key, future in _prefetches.items() if future.done()]:
+                del _prefetches[key]
+    for question in questions:
+        key = _prefetch_key(analysis, question)
+        with _prefetches_lock:
+            if key in _prefetches:
+                continue
+            _prefetches[key] = _executor.submit(answer_fn, question, analysis)
+
+def prefetched_answer(analysis, question, timeout=None):
+    """The prefetched answer, waiting for it if the request is already running.
+
+    None if it was never prefetched, failed, or had not started yet; a queued
+    prefetch is cancelled so the caller can ask directly instead of waiting
+    behind other sessions' prefetches.
+    """
+    key = _prefetch_key(analysis, question)
+    with _prefetches_lock:
+        future = _prefetches.get(key)
+    if future is None:
+        return None
+    if future.cancel():
+        with _prefetches_lock:
+            _prefetches.pop(key, None)
+        return None
+    try:
+        return future.result(timeout)
+    except Exception as e:
+        logger.info(f"Prefetched answer unavailable: {e}")
+        with _prefetches_lock:
+            _prefetches.pop(key, None)
+        return None
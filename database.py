@@ -0,0 +1,288 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.getenv("GREENTHREADS_DB", "greenthreads.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # seconds to wait for a free connection
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))  # page cache per connection
+
+class PoolTimeout(sqlite3.OperationalError):
+    pass
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections to one database file.
+
+    Up to size connections are kept open. When all are busy, up to
+    max_overflow extra connections are opened and closed again on release;
+    beyond that, callers wait up to timeout seconds and then get PoolTimeout.
+    A connection is only ever used by the thread holding it, so connections
+    are opened with check_same_thread=False and can move between Streamlit's
+    script threads.
+    """
+
+    def __init__(self, path, size=DB_POOL_SIZE, max_overflow=DB_POOL_MAX_OVERFLOW, timeout=DB_POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self._idle = []
+        self._open = 0
+        self._condition = threading.Condition()
+        self._acquired = 0
+        self._waited = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._overflow_opened = 0
+        self._timeouts = 0
+
+    def _create(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # WAL lets readers proceed while one writer commits; NORMAL sync is durable across
+        # application crashes and only risks the last transactions on power loss
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA busy_timeout=30000')
+        return conn
+
+    def acquire(self):
+        started = time.monotonic()
+        waited = False
+        with self._condition:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._open < self.size + self.max_overflow:
+                    self._open += 1
+                    if self._open > self.size:
+                        self._overflow_opened += 1
+                    conn = None
+                    break
+                waited = True
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"No database connection free after {self.timeout:g}s")
+                self._condition.wait(remaining)
+            wait_seconds = time.monotonic() - started
+            self._acquired += 1
+            self._waited += waited
+            self._wait_seconds += wait_seconds
+            self._max_wait_seconds = max(self._max_wait_seconds, wait_seconds)
+        if conn is None:
+            try:
+                conn = self._create()
+            except Exception:
+                with self._condition:
+                    self._open -= 1
+                    self._condition.notify()
+                raise
+        return conn
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            healthy = True
+        except sqlite3.Error:
+            healthy = False
+        with self._condition:
+            if healthy and len(self._idle) < self.size:
+                self._idle.append(conn)
+                conn = None
+            else:
+                self._open -= 1
+            self._condition.notify()
+        if conn is not None:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        """A pooled connection for the duration of the block; commits on success, rolls back on error."""
+        conn = self.acquire()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        with self._condition:
+            return {
+                "open": self._open,
+                "idle": len(self._idle),
+                "acquired": self._acquired,
+                "waited": self._waited,
+                "mean_wait_ms": 1000 * self._wait_seconds / self._acquired if self._acquired else 0.0,
+                "max_wait_ms": 1000 * self._max_wait_seconds,
+                "overflow_opened": self._overflow_opened,
+                "timeouts": self._timeouts,
+            }
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(path=None):
+    """The process-wide pool for a database file (the app database by default)."""
+    path = path or DB_PATH
+    with _pools_lock:
+        if path not in _pools:
+            _pools[path] = ConnectionPool(path)
+        return _pools[path]
+
+def get_connection(path=None):
+    return get_pool(path).connection()
+
+def pool_stats():
+    with _pools_lock:
+        pools = dict(_pools)
+    return {path: pool.stats() for path, pool in pools.items()}
+
+# Canonical designs columns. Older databases were created by either
+# main.init_db or design_studio.create_table, each with a different subset;
+# migration 1 adds whatever is missing instead of dropping the table.
+DESIGNS_COLUMNS = [
+    ("user_id", "TEXT"),
+    ("style", "TEXT"),
+    ("materials", "TEXT"),
+    ("clothing_type", "TEXT"),
+    ("production_method", "TEXT"),
+    ("packaging", "TEXT"),
+    ("production_location", "TEXT"),
+    ("shipping_method", "TEXT"),
+    ("base_color", "TEXT"),
+    ("custom_design", "TEXT"),
+    ("recycling_instructions", "TEXT"),
+    ("sustainability_score", "INTEGER"),
+    ("design_image", "BLOB"),  # legacy inline image, emptied by migration 4
+    ("timestamp", "DATETIME DEFAULT CURRENT_TIMESTAMP"),
+]
+
+def _table_columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def _create_base_schema(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS users
+                    (id INTEGER PRIMARY KEY, username TEXT UNIQUE, password TEXT)''')
+    columns = ",\n".join(f"{name} {column_type}" for name, column_type in DESIGNS_COLUMNS)
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS designs
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     {columns})''')
+    existing = _table_columns(conn, "designs")
+    for name, column_type in DESIGNS_COLUMNS:
+        if name not in existing:
+            # SQLite can't add a column with a non-constant default, so old rows get NULL timestamps
+            conn.execute(f"ALTER TABLE designs ADD COLUMN {name} {column_type.replace(' DEFAULT CURRENT_TIMESTAMP', '')}")
+
+def _create_design_indexes(conn):
+    # The dashboard's monthly index is created by migration 6
+    # design_studio.recent_design_thumbnails: WHERE user_id = ? ORDER BY timestamp DESC
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_designs_user_timestamp ON designs(user_id, timestamp)")
+
+def _drop_unused_design_indexes(conn):
+    # No query filters or sorts designs by timestamp alone or by score, so these
+    # only cost on every insert
+    conn.execute("DROP INDEX IF EXISTS idx_designs_timestamp")
+    conn.execute("DROP INDEX IF EXISTS idx_designs_score")
+
+def _create_question_popularity(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS question_popularity
+                    (question TEXT PRIMARY KEY,
+                    uses INTEGER NOT NULL DEFAULT 0)''')
+
+def _move_design_images(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS design_images
+                    (hash TEXT PRIMARY KEY,
+                    image BLOB NOT NULL,
+                    thumbnail BLOB,
+                    width INTEGER,
+                    height INTEGER,
+                    size INTEGER NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+    if "image_hash" not in _table_columns(conn, "designs"):
+        conn.execute("ALTER TABLE designs ADD COLUMN image_hash TEXT")
+    # Existing inline images move to the blob table; thumbnails are made lazily on first view
+    rows = conn.execute("SELECT id FROM designs WHERE design_image IS NOT NULL").fetchall()
+    for (design_id,) in rows:
+        data = conn.execute("SELECT design_image FROM designs WHERE id = ?", (design_id,)).fetchone()[0]
+        digest = hashlib.sha256(data).hexdigest()
+        conn.execute("INSERT OR IGNORE INTO design_images (hash, image, size) VALUES (?, ?, ?)", (digest, data, len(data)))
+        conn.execute("UPDATE designs SET image_hash = ?, design_image = NULL WHERE id = ?", (digest, design_id))
+
+def split_materials(materials):
+    """Materials from the comma-joined designs.materials text, without blanks or duplicates."""
+    seen = []
+    for material in (materials or "").split(","):
+        material = material.strip()
+        if material and material not in seen:
+            seen.append(material)
+    return seen
+
+def _create_design_materials(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS design_materials
+                    (design_id INTEGER NOT NULL REFERENCES designs(id) ON DELETE CASCADE,
+                    material TEXT NOT NULL,
+                    PRIMARY KEY (design_id, material)) WITHOUT ROWID''')
+    # Material distribution (GROUP BY material) and material filters, both index-only
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_design_materials_material ON design_materials(material, design_id)")
+    rows = conn.execute("SELECT id, materials FROM designs WHERE materials IS NOT NULL").fetchall()
+    conn.executemany("INSERT OR IGNORE INTO design_materials (design_id, material) VALUES (?, ?)",
+                     [(design_id, material) for design_id, materials in rows for material in split_materials(materials)])
+
+def _create_month_score_index(conn):
+    # Sustainability dashboard: GROUP BY strftime('%Y-%m', timestamp) with AVG(sustainability_score).
+    # timestamp is included because SQLite still reads the column behind the expression;
+    # with it the monthly aggregation is a covering index scan and never touches table rows
+    conn.execute("DROP INDEX IF EXISTS idx_designs_month_score")
+    conn.execute("CREATE INDEX idx_designs_month_score ON designs(strftime('%Y-%m', timestamp), sustainability_score, timestamp)")
+
+# Ordered (version, description, apply) steps. Each runs in its own
+# transaction together with the PRAGMA user_version bump, and must be safe to
+# re-run against a database that already has some of its objects.
+MIGRATIONS = [
+    (1, "canonical users and designs schema", _create_base_schema),
+    (2, "designs indexes for dashboard and per-user queries", _create_design_indexes),
+    (3, "fabric advisor question popularity", _create_question_popularity),
+    (4, "design images in a content-addressed blob table", _move_design_images),
+    (5, "normalized design_materials table", _create_design_materials),
+    (6, "covering monthly score index for the dashboard", _create_month_score_index),
+    (7, "drop designs indexes no query uses", _drop_unused_design_indexes),
+]
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(db_path=None):
+    """Bring the database up to the latest schema version. Returns the resulting version."""
+    conn = sqlite3.connect(db_path or DB_PATH, timeout=30, isolation_level=None)
+    try:
+        for version, description, apply in MIGRATIONS:
+            if schema_version(conn) >= version:
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have migrated while we waited for the write lock
+                if schema_version(conn) >= version:
+                    conn.execute("ROLLBACK")
+                    continue
+                apply(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            logger.info(f"Applied database migration {version}: {description}")
+        return schema_version(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,58 @@
+import hashlib
+import io
+import logging
+import os
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Design images live in the design_images table keyed by the SHA-256 of their
+# PNG bytes; designs rows only carry image_hash. Identical images (e.g. the
+# same cached variant saved twice) are stored once, and scans over designs
+# never page image data in.
+THUMBNAIL_SIZE = int(os.getenv("DESIGN_THUMBNAIL_SIZE", "256"))
+THUMBNAIL_QUALITY = int(os.getenv("DESIGN_THUMBNAIL_QUALITY", "75"))
+
+def image_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+def make_thumbnail(data):
+    """A WebP thumbnail no larger than THUMBNAIL_SIZE on either side, plus the original width and height."""
+    image = Image.open(io.BytesIO(data))
+    width, height = image.size
+    image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    thumbnail_buf = io.BytesIO()
+    image.save(thumbnail_buf, format="WEBP", quality=THUMBNAIL_QUALITY)
+    return thumbnail_buf.getvalue(), width, height
+
+def store_design_image(conn, data):
+    """Store image bytes (once per distinct image) on the caller's connection and return their hash."""
+    digest = image_hash(data)
+    if conn.execute('SELECT 1 FROM design_images WHERE hash = ?', (digest,)).fetchone():
+        return digest
+    try:
+        thumbnail, width, height = make_thumbnail(data)
+    except Exception as e:
+        logger.warning(f"Could not create a design thumbnail: {e}")
+        thumbnail, width, height = None, None, None
+    conn.execute('''INSERT OR IGNORE INTO design_images (hash, image, thumbnail, width, height, size)
+                    VALUES (?, ?, ?, ?, ?, ?)''', (digest, data, thumbnail, width, height, len(data)))
+    return digest
+
+def get_design_image(conn, digest):
+    row = conn.execute('SELECT image FROM design_images WHERE hash = ?', (digest,)).fetchone()
+    return row['image'] if row else None
+
+def get_design_thumbnail(conn, digest):
+    """The stored thumbnail; images moved out of designs by migration 4 get theirs made on first request."""
+    row = conn.execute('SELECT thumbnail FROM design_images WHERE hash = ?', (digest,)).fetchone()
+    if row is None:
+        return None
+    if row['thumbnail'] is not None:
+        return row['thumbnail']
+    image = get_design_image(conn, digest)
+    thumbnail, width, height = make_thumbnail(image)
+    conn.execute('UPDATE design_images SET thumbnail = ?, width = ?, height = ? WHERE hash = ?',
+                 (thumbnail, width, height, digest))
+    return thumbnail
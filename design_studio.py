@@ -1,142 +1,91 @@
-import io
 import json
 import os
-import sqlite3
 import uuid
 from PIL import Image
 from datetime import datetime
 from io import BytesIO
-import google.generativeai as genai
 import streamlit as st
-import torch
-from diffusers import StableDiffusionPipeline
 from pathlib import Path
 from dotenv import load_dotenv
 from flask import Flask, jsonify
-from google.api_core import exceptions
-from google.api_core import retry
+from database import get_connection, migrate
+from design_images import get_design_thumbnail
+from design_writer import get_design_writer
+from gemini_client import generate_json, generate_text
+from sustainability_scoring import explain_score, score_design
+from model_registry import FAILED, registry as model_registry
+from image_generation import (DEFAULT_GENERATION_PRESET, DEFAULT_SEED, GENERATION_PRESETS, LIVE_PREVIEWS, MAX_VARIANTS,
+                              build_design_prompt, generate_images, latents_to_preview, load_stable_diffusion,
+                              should_preview, warm_up_stable_diffusion)
+from generation_jobs import (CANCELLED, DONE, FINISHED, GENERATION_WORKERS, QUEUED, cancel_job, get_job_results, start_workers,
+                             submit_job, wait_for_job, workers_alive)
 import warnings
-import time
-from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
 warnings.filterwarnings('ignore')
 
-import os
-os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
-os.environ['PYTORCH_ENABLE_MPS_FALLBACK'] = '1'
-
 st.set_page_config(
     page_title="AI Sustainable Fashion Design Studio",
     layout="wide",
     initial_sidebar_state="collapsed"
 )
 
-st.cache_data.clear()
-st.cache_resource.clear()
-
 load_dotenv()
 
-app = Flask(__name__)
-
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-
-def get_db_connection():
-    try:
-        conn = sqlite3.connect('greenthreads.db')
-        conn.row_factory = sqlite3.Row
-        return conn
-    except sqlite3.Error:
-        return None
+# Upper bound on Gemini analysis calls in flight for a single page render
+ANALYSIS_MAX_WORKERS = int(os.getenv("ANALYSIS_MAX_WORKERS", "5"))
+# Default for the single structured "full design report" request
+BATCHED_ANALYSIS = os.getenv("BATCHED_DESIGN_ANALYSIS", "1") == "1"
+# Sustainability scores are computed locally; this only adds LLM-written explanation text
+LLM_SCORE_EXPLANATION = os.getenv("LLM_SCORE_EXPLANATION", "0") == "1"
+# Run diffusion in the generation worker pool instead of the Streamlit script thread
+USE_GENERATION_WORKERS = GENERATION_WORKERS > 0
+# Thumbnails shown in the "Your recent designs" strip
+RECENT_DESIGNS_LIMIT = int(os.getenv("RECENT_DESIGNS_LIMIT", "8"))
+# Acknowledge a save only once it is synced to disk (synchronous=FULL for its commit)
+DURABLE_DESIGN_SAVES = os.getenv("DURABLE_DESIGN_SAVES", "0") == "1"
+# How long the page waits for the background writer before reporting a save as pending
+SAVE_ACK_TIMEOUT = float(os.getenv("DESIGN_SAVE_ACK_TIMEOUT", "5"))
 
-def create_table():
-    conn = get_db_connection()
-    if conn:
-        try:
-            conn.execute('''CREATE TABLE IF NOT EXISTS designs
-                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id TEXT,
-                        style TEXT,
-                        materials TEXT,
-                        clothing_type TEXT,
-                        production_method TEXT,
-                        packaging TEXT,
-                        production_location TEXT,
-                        shipping_method TEXT,
-                        base_color TEXT,
-                        custom_design TEXT,
-                        sustainability_score INTEGER,
-                        design_image BLOB,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
-            conn.commit()
-        except sqlite3.Error:
-            pass
-        finally:
-            conn.close()
+app = Flask(__name__)
 
 def save_design_to_db(user_id, style, materials, clothing_type, production_method, 
-                     packaging, production_location, shipping_method, base_color, custom_design, sustainability_score):
-    conn = get_db_connection()
-    if not conn:
-        return None
-        
-    try:
-        materials_str = ", ".join(materials) if isinstance(materials, list) else materials
-        design_image = st.session_state.generated_design if 'generated_design' in st.session_state else None
-        
-        cursor = conn.cursor()
-        insert_query = """
-            INSERT INTO designs (
-                user_id, style, materials, clothing_type, production_method, 
-                packaging, production_location, shipping_method, base_color, 
-                custom_design, sustainability_score, design_image
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        
-        cursor.execute(insert_query, (
-            user_id, style, materials_str, clothing_type, production_method,
-            packaging, production_location, shipping_method, base_color,
-            custom_design, sustainability_score, design_image
-        ))
-        
-        conn.commit()
-        inserted_id = cursor.lastrowid
-        
-        cursor.execute("SELECT * FROM designs WHERE id = ?", (inserted_id,))
-        verification = cursor.fetchone()
-        
-        if verification:
-            print(f"Successfully saved design with ID: {inserted_id}")
-            return inserted_id
-        else:
-            print("Verification failed - data not saved properly")
-            return None
-            
-    except Exception:
-        if conn:
-            conn.rollback()
-        return None
-    finally:
-        if conn:
-            conn.close()
+                     packaging, production_location, shipping_method, base_color, custom_design, sustainability_score,
+                     durable=DURABLE_DESIGN_SAVES):
+    """Queue the design, with the image in st.session_state.generated_design, for the background writer.
+
+    Returns a Future that resolves to the new design ID once the write has committed.
+    """
+    materials_str = ", ".join(materials) if isinstance(materials, list) else materials
+    design_image = st.session_state.generated_design if 'generated_design' in st.session_state else None
+    
+    return get_design_writer().submit({
+        'user_id': user_id,
+        'style': style,
+        'materials': materials_str,
+        'clothing_type': clothing_type,
+        'production_method': production_method,
+        'packaging': packaging,
+        'production_location': production_location,
+        'shipping_method': shipping_method,
+        'base_color': base_color,
+        'custom_design': custom_design,
+        'sustainability_score': sustainability_score,
+        'image': design_image
+    }, durable=durable)
 
 def verify_database_storage():
-    conn = get_db_connection()
-    if not conn:
-        return False
-        
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM designs ORDER BY id DESC LIMIT 1")
-        last_record = cursor.fetchone()
+        with get_connection() as conn:
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(designs)")}
+            last_record = conn.execute("SELECT id FROM designs ORDER BY id DESC LIMIT 1").fetchone()
         
         if last_record:
             required_fields = ['id', 'user_id', 'style', 'materials', 'clothing_type', 
                              'production_method', 'packaging', 'production_location', 
                              'shipping_method', 'base_color', 'custom_design', 
-                             'sustainability_score', 'timestamp']
-                             
-            record_dict = dict(zip([description[0] for description in cursor.description], last_record))
+                             'sustainability_score', 'image_hash', 'timestamp']
             
-            missing_fields = [field for field in required_fields if field not in record_dict]
+            missing_fields = [field for field in required_fields if field not in columns]
             
             if missing_fields:
                 print(f"Missing fields in database: {missing_fields}")
@@ -147,65 +96,45 @@ def verify_database_storage():
             
     except Exception:
         return False
-    finally:
-        if conn:
-            conn.close()
 
-@st.cache_resource
+def recent_design_thumbnails(user_id, limit=RECENT_DESIGNS_LIMIT):
+    """[(design_id, clothing_type, thumbnail_webp)] for a user's newest designs with an image."""
+    with get_connection() as conn:
+        rows = conn.execute("""
+            SELECT id, clothing_type, image_hash FROM designs
+            WHERE user_id = ? AND image_hash IS NOT NULL
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        """, (user_id, limit)).fetchall()
+        return [(row['id'], row['clothing_type'], get_design_thumbnail(conn, row['image_hash'])) for row in rows]
+
+# In worker mode the pipeline lives in the generation worker processes instead
+if not USE_GENERATION_WORKERS:
+    model_registry.register("stable_diffusion", load_stable_diffusion, warm_up_stable_diffusion)
+
 def load_models():
-    try:
-        model_id = "runwayml/stable-diffusion-v1-5"
-        pipe = StableDiffusionPipeline.from_pretrained(
-            model_id,
-            torch_dtype=torch.float32,
-            safety_checker=None,
-            requires_safety_checker=False
-        )
-        pipe = pipe.to("cpu")
-        pipe.enable_attention_slicing()
-        pipe.enable_vae_tiling()
-        pipe.scheduler.num_inference_steps = 20
-        return pipe
-    except Exception:
-        return None
-        
-def generate_ai_image(pipe, prompt, progress_bar):
+    """Return the resident Stable Diffusion pipeline, or None while it is still loading."""
+    return model_registry.get("stable_diffusion")
+
+def generate_ai_images(pipe, prompt, progress_bar, preset=DEFAULT_GENERATION_PRESET, seed=DEFAULT_SEED, num_variants=1, preview=None):
+    """Generate design variants in-process. Returns [(seed, png_bytes)] or None on failure.
+
+    preview is an optional st.empty() placeholder that shows a cheap latent preview every few steps.
+    """
     if pipe is None:
         return None
-    
+
+    def on_step(step, total_steps, latents):
+        try:
+            progress_bar.progress(min(100, int((step / total_steps) * 100)))
+            if preview is not None and should_preview(step, total_steps):
+                preview.image(latents_to_preview(latents), caption=f"Preview at step {step} of {total_steps}")
+        except Exception:
+            pass
+
     try:
-        with torch.no_grad():
-            generation_params = {
-                "prompt": prompt,
-                "num_inference_steps": 20,
-                "guidance_scale": 7.0,
-                "height": 512,
-                "width": 512,
-                "num_images_per_prompt": 1
-            }
-            
-            def callback(step, timestep, latents):
-                try:
-                    progress = min(100, int((step / generation_params["num_inference_steps"]) * 100))
-                    progress_bar.progress(progress)
-                except Exception:
-                    pass
-            
-            pipe.disable_attention_slicing()
-            pipe.disable_vae_tiling()
-            
-            output = pipe(
-                **generation_params,
-                callback=callback if progress_bar else None,
-                callback_steps=1
-            )
-            
-            if not output.images or len(output.images) == 0:
-                return None
-                
-            image = output.images[0]
-            return image
-            
+        return generate_images(pipe, prompt, preset=preset, seed=seed, num_variants=num_variants,
+                               on_step=on_step if progress_bar or preview is not None else None)
     except Exception:
         return None
 
@@ -220,39 +149,16 @@ def init_session_state():
         st.session_state.formatted_overall_score = None
     if 'design_history' not in st.session_state:
         st.session_state.design_history = []
-
-retry_strategy = retry.Retry(
-    initial=120.0,
-    maximum=300.0,
-    multiplier=2,
-    predicate=retry.if_exception_type(
-        exceptions.ServiceUnavailable,
-        exceptions.InternalServerError,
-        exceptions.TooManyRequests,
-        exceptions.ResourceExhausted
-    ),
-    deadline=600.0
-)
-
-@lru_cache(maxsize=100)
-def cached_generate_content(prompt, model_name='gemini-1.5-pro'):
-    model = genai.GenerativeModel(model_name)
-    try:
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception:
-        return None
-
-@retry_strategy
-def generate_content_with_retry(model, prompt):
-    try:
-        response = cached_generate_content(prompt, model.model_name)
-        if response is None:
-            raise Exception("No response from API")
-        return response
-    except Exception:
-        time.sleep(120)
-        return None
+    if 'design_report' not in st.session_state:
+        st.session_state.design_report = None
+    if 'design_variants' not in st.session_state:
+        st.session_state.design_variants = []
+    if 'saved_design_id' not in st.session_state:
+        st.session_state.saved_design_id = None
+    if 'pending_design_save' not in st.session_state:
+        st.session_state.pending_design_save = None
+    if 'generation_job_id' not in st.session_state:
+        st.session_state.generation_job_id = None
 
 def remove_all_asterisks(text):
     if text:
@@ -260,7 +166,6 @@ def remove_all_asterisks(text):
     return text
 
 def get_sustainability_recommendations(style, materials, clothing_type, custom_design, base_color):
-    model = genai.GenerativeModel('gemini-1.5-pro')
     prompt = f"""
     As a sustainable fashion expert, provide recommendations to improve the sustainability of the following design:
     
@@ -287,7 +192,7 @@ def get_sustainability_recommendations(style, materials, clothing_type, custom_d
     Remember to emphasize sustainable fashion practices throughout your response.
     """
     try:
-        response = generate_content_with_retry(model, prompt)
+        response = generate_text(prompt, 'gemini-1.5-pro')
         if response:
             return remove_all_asterisks(response)
         else:
@@ -311,50 +216,32 @@ def get_sustainability_recommendations(style, materials, clothing_type, custom_d
         - Use compostable packaging to reduce waste.
         """
 
-def calculate_sustainability_score(materials, production_method, packaging):
-    model = genai.GenerativeModel('gemini-1.5-pro')
-    prompt = f"""
-    Calculate a sustainability score (0-100) for a fashion design with the following characteristics:
-    
-    Materials: {', '.join(materials)}
-    Production Method: {production_method}
-    Packaging: {packaging}
-    
-    Consider factors such as:
-    - Environmental impact of materials
-    - Energy consumption in production
-    - Water usage
-    - Chemical use
-    - Waste generation
-    - Recyclability
-    - Biodegradability
-    
-    Provide the numerical score (0-100) followed by a brief explanation.
-    Format your response as follows:
-    Sustainability Score: [score]
-    Explanation:
-    [Your brief explanation here]
-    Emphasize sustainable fashion practices in your explanation.
-    """
-    try:
-        response = generate_content_with_retry(model, prompt)
-        if response:
-            return remove_all_asterisks(response)
-        else:
-            return f"""
-            Sustainability Score: 70
-            Explanation:
-            The design uses eco-friendly materials and sustainable packaging, reducing environmental impact. Local production methods further lower emissions, though improvements in water usage could enhance the score.
-            """
-    except Exception:
-        return f"""
-        Sustainability Score: 70
-        Explanation:
-        The design uses eco-friendly materials and sustainable packaging, reducing environmental impact. Local production methods further lower emissions, though improvements in water usage could enhance the score.
+def calculate_sustainability_score(materials, production_method, packaging, explain_with_llm=False):
+    """Score the design locally; the LLM is only asked, optionally, to phrase the explanation."""
+    result = score_design(materials, production_method, packaging)
+    explanation = explain_score(result, materials, production_method, packaging)
+    if explain_with_llm:
+        prompt = f"""
+        A fashion design has been given a sustainability score of {result['score']} out of 100.
+
+        Materials: {', '.join(materials)} (component score {result['components']['materials']})
+        Production Method: {production_method} (component score {result['components']['production']})
+        Packaging: {packaging} (component score {result['components']['packaging']})
+
+        Write a brief explanation of this score, covering the environmental impact of the materials,
+        energy and water use, chemical use, waste generation, recyclability and biodegradability.
+        Do not restate or change the score.
+        Emphasize sustainable fashion practices in your explanation.
         """
+        try:
+            response = generate_text(prompt, 'gemini-1.5-pro')
+            if response:
+                explanation = remove_all_asterisks(response).strip()
+        except Exception:
+            pass
+    return f"Sustainability Score: {result['score']}\nExplanation:\n{explanation}"
 
 def generate_zero_waste_pattern(clothing_type, base_color):
-    model = genai.GenerativeModel('gemini-1.5-pro')
     prompt = f"""
     Generate a detailed description of a zero-waste pattern for a {clothing_type} in {base_color}. Include:
     
@@ -373,7 +260,7 @@ def generate_zero_waste_pattern(clothing_type, base_color):
     Emphasize sustainable fashion practices throughout your response.
     """
     try:
-        response = generate_content_with_retry(model, prompt)
+        response = generate_text(prompt, 'gemini-1.5-pro')
         if response:
             return remove_all_asterisks(response)
         else:
@@ -396,7 +283,6 @@ def generate_zero_waste_pattern(clothing_type, base_color):
         """
 
 def suggest_eco_friendly_dyes(base_color):
-    model = genai.GenerativeModel('gemini-1.5-pro')
     prompt = f"""
     Suggest eco-friendly dye options for achieving a {base_color} color in sustainable fashion. For each suggestion, provide:
     
@@ -414,7 +300,7 @@ def suggest_eco_friendly_dyes(base_color):
     Emphasize sustainable fashion practices throughout your response.
     """
     try:
-        response = generate_content_with_retry(model, prompt)
+        response = generate_text(prompt, 'gemini-1.5-pro')
         if response:
             return remove_all_asterisks(response)
         else:
@@ -433,7 +319,6 @@ def suggest_eco_friendly_dyes(base_color):
         """
 
 def estimate_carbon_footprint(materials, production_location, shipping_method):
-    model = genai.GenerativeModel('gemini-1.5-pro')
     prompt = f"""
     Estimate the carbon footprint for a fashion item with the following characteristics:
     
@@ -456,7 +341,7 @@ def estimate_carbon_footprint(materials, production_location, shipping_method):
     Emphasize sustainable fashion practices throughout your response.
     """
     try:
-        response = generate_content_with_retry(model, prompt)
+        response = generate_text(prompt, 'gemini-1.5-pro')
         if response:
             return remove_all_asterisks(response)
         else:
@@ -477,7 +362,6 @@ def estimate_carbon_footprint(materials, production_location, shipping_method):
         """
 
 def recommend_ethical_production(production_location):
-    model = genai.GenerativeModel('gemini-1.5-pro')
     prompt = f"""
     Recommend ethical production options for fashion manufacturing in or near {production_location}. For each recommendation, provide:
     
@@ -497,7 +381,7 @@ def recommend_ethical_production(production_location):
     Emphasize sustainable fashion practices throughout your response.
     """
     try:
-        response = generate_content_with_retry(model, prompt)
+        response = generate_text(prompt, 'gemini-1.5-pro')
         if response:
             return remove_all_asterisks(response)
         else:
@@ -515,6 +399,78 @@ def recommend_ethical_production(production_location):
         - Partner with local cooperatives specializing in sustainable garments, focusing on eco-friendly production.
         """
 
+# Report section -> (score label, body label) in the text format the per-section prompts produce
+DESIGN_REPORT_SECTIONS = {
+    "recommendations": ("Sustainability Score", "Recommendations"),
+    "zero_waste_pattern": ("Zero-Waste Score", "Pattern Description"),
+    "eco_friendly_dyes": ("Eco-Friendliness Score", "Dye Suggestions"),
+    "carbon_footprint": ("Carbon Footprint Score", "Estimate Details"),
+    "ethical_production": ("Ethical Production Score", "Recommendations"),
+}
+
+DESIGN_REPORT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        section: {
+            "type": "OBJECT",
+            "properties": {"score": {"type": "INTEGER"}, "details": {"type": "STRING"}},
+            "required": ["score", "details"],
+        }
+        for section in DESIGN_REPORT_SECTIONS
+    },
+    "required": list(DESIGN_REPORT_SECTIONS),
+}
+
+def parse_design_report(report):
+    """Format each valid report section like its per-section prompt would; invalid sections map to None."""
+    if not isinstance(report, dict):
+        raise ValueError("Design report is not a JSON object")
+    sections = {}
+    for section, (score_label, body_label) in DESIGN_REPORT_SECTIONS.items():
+        entry = report.get(section)
+        score = entry.get("score") if isinstance(entry, dict) else None
+        details = entry.get("details") if isinstance(entry, dict) else None
+        if isinstance(score, int) and 0 <= score <= 100 and isinstance(details, str) and details.strip():
+            sections[section] = remove_all_asterisks(f"{score_label}: {score}\n{body_label}:\n{details.strip()}")
+        else:
+            sections[section] = None
+    if not any(sections.values()):
+        raise ValueError("Design report has no valid sections")
+    return sections
+
+def generate_full_design_report(current_data):
+    """Produce all five analyses in one structured request.
+
+    Returns a dict of section -> formatted text (None for sections that failed
+    validation), or None if the request failed outright.
+    """
+    prompt = f"""
+    As a sustainable fashion expert, analyze the following design in full:
+
+    Style: {current_data['style']}
+    Materials: {', '.join(current_data['materials'])}
+    Clothing Type: {current_data['clothing_type']}
+    Production Method: {current_data['production_method']}
+    Packaging: {current_data['packaging']}
+    Production Location: {current_data['production_location']}
+    Shipping Method: {current_data['shipping_method']}
+    Base Color: {current_data['base_color']}
+    Custom Design: {current_data['custom_design']}
+
+    Return a JSON object with these sections, each with a "score" (integer 0-100) and "details" (text):
+    - recommendations: actionable recommendations on material substitutions, production process, longevity, ethics, and packaging and shipping
+    - zero_waste_pattern: a zero-waste pattern for the garment (layout, cutting instructions, assembly steps, tips for minimizing fabric waste)
+    - eco_friendly_dyes: eco-friendly dye options for the base color (source, environmental benefits, application process, limitations)
+    - carbon_footprint: estimated CO2e with a breakdown by materials, production and shipping, plus reduction suggestions; a higher score means a lower footprint
+    - ethical_production: ethical production options in or near the production location (certifications, practices, specialties)
+
+    Emphasize sustainable fashion practices throughout.
+    """
+    try:
+        return generate_json(prompt, DESIGN_REPORT_SCHEMA, 'gemini-1.5-pro', validate=parse_design_report)
+    except Exception:
+        return None
+
 def extract_sustainability_score(overall_score):
     try:
         lines = overall_score.split('\n')
@@ -526,6 +482,161 @@ def extract_sustainability_score(overall_score):
     except (StopIteration, IndexError, ValueError):
         return 50, f"**Sustainability Score: 50**\n{overall_score}"
 
+def design_analysis_sections(current_data):
+    """Return (report section, expander title, heading, function, args) for each design analysis."""
+    return [
+        ("recommendations", "Sustainability Recommendations", "Sustainability Analysis & Recommendations",
+         get_sustainability_recommendations,
+         (current_data['style'], current_data['materials'], current_data['clothing_type'],
+          current_data['custom_design'], current_data['base_color'])),
+        ("zero_waste_pattern", "Zero-Waste Pattern Suggestion", "Zero-Waste Pattern Details",
+         generate_zero_waste_pattern,
+         (current_data['clothing_type'], current_data['base_color'])),
+        ("eco_friendly_dyes", "Eco-Friendly Dye Suggestions", "Sustainable Dyeing Options",
+         suggest_eco_friendly_dyes,
+         (current_data['base_color'],)),
+        ("carbon_footprint", "Carbon Footprint Estimate", "Environmental Impact Analysis",
+         estimate_carbon_footprint,
+         (current_data['materials'], current_data['production_location'], current_data['shipping_method'])),
+        ("ethical_production", "Ethical Production Recommendations", "Ethical Manufacturing Guidelines",
+         recommend_ethical_production,
+         (current_data['production_location'],)),
+    ]
+
+def display_design_analyses(current_data, report=None):
+    """Fill each analysis expander, taking sections from the batched report where valid.
+
+    Remaining sections fall back to their own prompts, run concurrently, and
+    each expander is filled as its result arrives.
+    """
+    report = report or {}
+    sections = design_analysis_sections(current_data)
+    placeholders = []
+    pending = []
+    for index, (section, title, heading, fn, args) in enumerate(sections):
+        with st.expander(title):
+            st.markdown(f'<div style="font-size: 24px; color: #8B4513; border-bottom: 2px solid #DAA520; padding-bottom: 8px; margin-bottom: 16px;">{heading}</div>', unsafe_allow_html=True)
+            placeholder = st.empty()
+            if report.get(section):
+                placeholder.markdown(f'<div style="color: black;">{report[section]}</div>', unsafe_allow_html=True)
+            else:
+                placeholder.markdown('<div style="color: black;">Generating...</div>', unsafe_allow_html=True)
+                pending.append((index, fn, args))
+            placeholders.append(placeholder)
+
+    if not pending:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, min(ANALYSIS_MAX_WORKERS, len(pending)))) as executor:
+        futures = {executor.submit(fn, *args): index for index, fn, args in pending}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception:
+                result = "This analysis is temporarily unavailable. Please try again later."
+            placeholders[futures[future]].markdown(f'<div style="color: black;">{result}</div>', unsafe_allow_html=True)
+
+def save_current_design():
+    """Persist the current design data together with the selected image in st.session_state.generated_design."""
+    data = st.session_state.current_data
+    future = save_design_to_db(
+        user_id="default_user",
+        style=data['style'],
+        materials=data['materials'],
+        clothing_type=data['clothing_type'],
+        production_method=data['production_method'],
+        packaging=data['packaging'],
+        production_location=data['production_location'],
+        shipping_method=data['shipping_method'],
+        base_color=data['base_color'],
+        custom_design=data['custom_design'],
+        sustainability_score=data.get('sustainability_score')
+    )
+    st.session_state.saved_design_id = None
+    st.session_state.pending_design_save = future
+    return future
+
+def display_save_status():
+    """Show the outcome of the last save, waiting briefly for the background writer if it is still pending."""
+    future = st.session_state.pending_design_save
+    if future is not None:
+        try:
+            st.session_state.saved_design_id = future.result(timeout=SAVE_ACK_TIMEOUT)
+        except FutureTimeoutError:
+            st.info("Saving your design...")
+            return
+        except Exception:
+            st.error("Your design could not be saved. Please try again.")
+        st.session_state.pending_design_save = None
+    if st.session_state.saved_design_id:
+        st.markdown(f'<div style="background-color: #8B4513; color: white; padding: 10px; border-radius: 5px;">Design saved successfully with ID: {st.session_state.saved_design_id}</div>', unsafe_allow_html=True)
+
+def finish_generation(images, generation_params):
+    """Store generated variants [(seed, png_bytes)], score the design and save it when there is a single variant."""
+    design = generation_params['design']
+    st.session_state.current_data = design
+    st.session_state.design_variants = [{'seed': variant_seed, 'image': image} for variant_seed, image in images]
+    st.session_state.generated_design = images[0][1]
+    st.session_state.saved_design_id = None
+    st.session_state.pending_design_save = None
+    st.session_state.current_base_color = design['base_color']
+    st.session_state.current_clothing_type = design['clothing_type']
+
+    report = generate_full_design_report(design) if generation_params['batched_analysis'] else None
+    st.session_state.design_report = report
+
+    overall_score = calculate_sustainability_score(design['materials'], design['production_method'], design['packaging'], explain_with_llm=LLM_SCORE_EXPLANATION)
+    sustainability_score, formatted_overall_score = extract_sustainability_score(overall_score)
+    st.session_state.formatted_overall_score = formatted_overall_score
+    design['sustainability_score'] = sustainability_score
+
+    # With several variants the designer picks one before it is saved
+    if len(images) == 1:
+        save_current_design()
+
+def attach_to_generation_job(job_id):
+    """Follow a queued or running generation job until it finishes, then take over its results."""
+    # Clicking this reruns the page, which interrupts the wait below
+    if st.button("Cancel generation", key="cancel_generation_button"):
+        cancel_job(job_id)
+
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    preview = st.empty()
+
+    def on_update(job):
+        if job['status'] == QUEUED:
+            status_text.caption("Waiting for an image generation worker...")
+        elif job['total_steps']:
+            status_text.caption(f"Step {job['step']} of {job['total_steps']}")
+        progress_bar.progress(min(100, int(job['progress'] * 100)))
+        if job['preview']:
+            preview.image(job['preview'], caption=f"Preview at step {job['step']} of {job['total_steps']}")
+
+    with st.spinner("Generating Sustainable Design..."):
+        job = wait_for_job(job_id, on_update)
+
+    status_text.empty()
+    preview.empty()
+    st.session_state.generation_job_id = None
+    st.session_state.finished_job_id = job_id
+    if "job" in st.query_params:
+        del st.query_params["job"]
+
+    if job is None:
+        return
+    if job['status'] == DONE:
+        images = get_job_results(job_id)
+        if images:
+            finish_generation(images, job['params'])
+    elif job['status'] == CANCELLED:
+        st.info("Image generation cancelled.")
+    elif job['status'] not in FINISHED:
+        cancel_job(job_id)
+        st.error("Image generation timed out. Please try again.")
+    else:
+        st.error(f"Image generation failed: {job['error']}" if job['error'] else "Image generation failed. Please try again.")
+
 def display_design_studio():
     st.markdown("""
     <style>
@@ -722,10 +833,18 @@ def display_design_studio():
         st.session_state.formatted_overall_score = None
     if 'design_history' not in st.session_state:
         st.session_state.design_history = []
+    if 'design_report' not in st.session_state:
+        st.session_state.design_report = None
+    if 'design_variants' not in st.session_state:
+        st.session_state.design_variants = []
+    if 'saved_design_id' not in st.session_state:
+        st.session_state.saved_design_id = None
+    if 'pending_design_save' not in st.session_state:
+        st.session_state.pending_design_save = None
+    if 'generation_job_id' not in st.session_state:
+        st.session_state.generation_job_id = None
 
     image_generator = load_models()
-    if image_generator is None:
-        return
 
     styles = ["Casual", "Formal", "Sporty", "Vintage", "Bohemian", "Minimalist", "Avant-garde", "Streetwear", "Romantic", "Preppy", "Other"]
     materials = ["Organic Cotton", "Recycled Polyester", "Hemp", "Tencel", "Bamboo", "Cork", "Recycled Nylon", "Piñatex", "Econyl", "Recycled Wool", "Organic Linen", "Soy Fabric", "Qmilk", "Orange Fiber", "Recycled Denim", "Other"]
@@ -774,6 +893,26 @@ def display_design_studio():
 
         custom_design = st.text_area("Custom design description (optional)", "", key="custom_design")
 
+        generation_preset = st.radio(
+            "Generation mode",
+            list(GENERATION_PRESETS),
+            index=list(GENERATION_PRESETS).index(DEFAULT_GENERATION_PRESET) if DEFAULT_GENERATION_PRESET in GENERATION_PRESETS else len(GENERATION_PRESETS) - 1,
+            horizontal=True,
+            help="Draft previews quickly at lower resolution; Quality uses the full 20-step pipeline.",
+            key="generation_preset"
+        )
+
+        seed = st.number_input("Seed", min_value=0, max_value=2**32 - 1, value=DEFAULT_SEED, step=1,
+                               help="The same design options and seed reproduce the same image.", key="seed")
+
+        num_variants = st.slider("Variants", min_value=1, max_value=MAX_VARIANTS, value=1,
+                                 help="Generate several options in one pass, each with its own seed.", key="num_variants")
+
+        live_preview = st.checkbox("Live preview while generating", value=LIVE_PREVIEWS,
+                                   help="Shows a rough preview every few steps so you can stop a generation early.", key="live_preview")
+
+        batched_analysis = st.checkbox("Batched analysis (one request for the full report)", value=BATCHED_ANALYSIS, key="batched_analysis")
+
     with col2:
         st.markdown("""
         <div h2 style="text-align:left; font-size: 1.8rem; font-weight: bold; color: #333333 !important;">
@@ -781,7 +920,17 @@ def display_design_studio():
         </div>
         """, unsafe_allow_html=True)
 
-        if st.button("Generate Sustainable Design", key="generate_button"):
+        if USE_GENERATION_WORKERS:
+            if workers_alive() == 0:
+                st.warning("No image generation worker is running yet. Jobs will wait in the queue until one starts.")
+        elif image_generator is None:
+            if model_registry.status("stable_diffusion") == FAILED:
+                st.error("The image generation model could not be loaded. Please contact support.")
+            else:
+                st.info(f"The image generation model is {model_registry.status('stable_diffusion')}. You can fill in your design while it gets ready.")
+                st.button("Check again", key="check_model_status")
+
+        if st.button("Generate Sustainable Design", key="generate_button", disabled=not USE_GENERATION_WORKERS and image_generator is None):
             if not selected_materials:
                 return
 
@@ -797,47 +946,59 @@ def display_design_studio():
                 'custom_design': custom_design
             }
 
-            progress_bar = st.progress(0)
+            prompt = build_design_prompt(style, clothing_type, base_color, selected_materials, custom_design)
 
-            try:
-                with st.spinner("Generating Sustainable Design..."):
-                    prompt = f"A sustainable {style.lower()} {clothing_type.lower()} in {base_color.lower()} color made from {', '.join(selected_materials).lower()}. The primary color of the garment is {base_color.lower()}. Highly detailed fashion design with emphasis on eco-friendly features and ethical production. Show the garment in a natural, environmentally conscious setting."
-                    if custom_design:
-                        prompt += f" {custom_design}"
-
-                    img = generate_ai_image(image_generator, prompt, progress_bar)
-                    if img:
-                        design_buf = io.BytesIO()
-                        img.save(design_buf, format="PNG")
-                        design_image_bytes = design_buf.getvalue()
-
-                        st.session_state.generated_design = design_image_bytes
-                        st.session_state.current_base_color = base_color
-                        st.session_state.current_clothing_type = clothing_type
-
-                        overall_score = calculate_sustainability_score(selected_materials, production_method, packaging)
-                        sustainability_score, formatted_overall_score = extract_sustainability_score(overall_score)
-                        st.session_state.formatted_overall_score = formatted_overall_score
-
-                        design_id = save_design_to_db(
-                            user_id="default_user",
-                            style=style,
-                            materials=selected_materials,
-                            clothing_type=clothing_type,
-                            production_method=production_method,
-                            packaging=packaging,
-                            production_location=production_location,
-                            shipping_method=shipping_method,
-                            base_color=base_color,
-                            custom_design=custom_design,
-                            sustainability_score=sustainability_score
-                        )
-
-                        if design_id:
-                            st.markdown(f'<div style="background-color: #8B4513; color: white; padding: 10px; border-radius: 5px;">Design saved successfully with ID: {design_id}</div>', unsafe_allow_html=True)
+            generation_params = {
+                'prompt': prompt,
+                'preset': generation_preset,
+                'seed': int(seed),
+                'num_variants': num_variants,
+                'live_preview': live_preview,
+                'design': st.session_state.current_data,
+                'batched_analysis': batched_analysis
+            }
 
-            except Exception:
-                return
+            if USE_GENERATION_WORKERS:
+                job_id = submit_job(generation_params)
+                st.session_state.generation_job_id = job_id
+                # Lets a reloaded page attach to the same job
+                st.query_params["job"] = job_id
+            else:
+                # Any widget interaction reruns the script and abandons this generation
+                st.button("Stop generation", key="stop_generation_button")
+                progress_bar = st.progress(0)
+                preview = st.empty() if live_preview else None
+                try:
+                    with st.spinner("Generating Sustainable Design..."):
+                        images = generate_ai_images(image_generator, prompt, progress_bar, preset=generation_preset, seed=int(seed), num_variants=num_variants, preview=preview)
+                        if preview is not None:
+                            preview.empty()
+                        if images:
+                            finish_generation(images, generation_params)
+                except Exception:
+                    return
+
+        pending_job_id = st.session_state.get('generation_job_id') or st.query_params.get("job")
+        if pending_job_id and pending_job_id != st.session_state.get('finished_job_id'):
+            attach_to_generation_job(pending_job_id)
+
+        if len(st.session_state.design_variants) > 1:
+            variants = st.session_state.design_variants
+            variant_columns = st.columns(len(variants))
+            for variant_index, (column, variant) in enumerate(zip(variant_columns, variants)):
+                with column:
+                    st.image(variant['image'], caption=f"Variant {variant_index + 1} (seed {variant['seed']})")
+            selected_variant = st.radio(
+                "Choose a variant",
+                list(range(len(variants))),
+                format_func=lambda i: f"Variant {i + 1}",
+                horizontal=True,
+                key="selected_variant"
+            )
+            st.session_state.generated_design = variants[selected_variant]['image']
+            if st.session_state.saved_design_id is None and st.session_state.pending_design_save is None:
+                if st.button("Save Selected Design", key="save_variant_button"):
+                    save_current_design()
 
         if st.session_state.generated_design:
             try:
@@ -853,43 +1014,7 @@ def display_design_studio():
                 st.markdown("**Sustainability Score: 70**\nThe design uses eco-friendly materials and sustainable packaging, reducing environmental impact. Local production methods further lower emissions, though improvements in water usage could enhance the score.", unsafe_allow_html=True)
 
             if st.session_state.current_data:
-                with st.expander("Sustainability Recommendations"):
-                    st.markdown('<div style="font-size: 24px; color: #8B4513; border-bottom: 2px solid #DAA520; padding-bottom: 8px; margin-bottom: 16px;">Sustainability Analysis & Recommendations</div>', unsafe_allow_html=True)
-                    recommendations = get_sustainability_recommendations(
-                        st.session_state.current_data['style'],
-                        st.session_state.current_data['materials'],
-                        st.session_state.current_data['clothing_type'],
-                        st.session_state.current_data['custom_design'],
-                        st.session_state.current_data['base_color']
-                    )
-                    st.markdown(f'<div style="color: black;">{recommendations}</div>', unsafe_allow_html=True)
-
-                with st.expander("Zero-Waste Pattern Suggestion"):
-                    st.markdown('<div style="font-size: 24px; color: #8B4513; border-bottom: 2px solid #DAA520; padding-bottom: 8px; margin-bottom: 16px;">Zero-Waste Pattern Details</div>', unsafe_allow_html=True)
-                    zero_waste_pattern = generate_zero_waste_pattern(
-                        st.session_state.current_data['clothing_type'],
-                        st.session_state.current_data['base_color']
-                    )
-                    st.markdown(f'<div style="color: black;">{zero_waste_pattern}</div>', unsafe_allow_html=True)
-
-                with st.expander("Eco-Friendly Dye Suggestions"):
-                    st.markdown('<div style="font-size: 24px; color: #8B4513; border-bottom: 2px solid #DAA520; padding-bottom: 8px; margin-bottom: 16px;">Sustainable Dyeing Options</div>', unsafe_allow_html=True)
-                    dye_suggestions = suggest_eco_friendly_dyes(st.session_state.current_data['base_color'])
-                    st.markdown(f'<div style="color: black;">{dye_suggestions}</div>', unsafe_allow_html=True)
-
-                with st.expander("Carbon Footprint Estimate"):
-                    st.markdown('<div style="font-size: 24px; color: #8B4513; border-bottom: 2px solid #DAA520; padding-bottom: 8px; margin-bottom: 16px;">Environmental Impact Analysis</div>', unsafe_allow_html=True)
-                    carbon_footprint = estimate_carbon_footprint(
-                        st.session_state.current_data['materials'],
-                        st.session_state.current_data['production_location'],
-                        st.session_state.current_data['shipping_method']
-                    )
-                    st.markdown(f'<div style="color: black;">{carbon_footprint}</div>', unsafe_allow_html=True)
-
-                with st.expander("Ethical Production Recommendations"):
-                    st.markdown('<div style="font-size: 24px; color: #8B4513; border-bottom: 2px solid #DAA520; padding-bottom: 8px; margin-bottom: 16px;">Ethical Manufacturing Guidelines</div>', unsafe_allow_html=True)
-                    ethical_production = recommend_ethical_production(st.session_state.current_data['production_location'])
-                    st.markdown(f'<div style="color: black;">{ethical_production}</div>', unsafe_allow_html=True)
+                display_design_analyses(st.session_state.current_data, st.session_state.design_report)
 
             if st.session_state.generated_design:
                 try:
@@ -904,8 +1029,21 @@ def display_design_studio():
                 except Exception:
                     pass
 
+            display_save_status()
+
+        try:
+            recent_designs = recent_design_thumbnails("default_user")
+        except Exception:
+            recent_designs = []
+        if recent_designs:
+            with st.expander("Your recent designs"):
+                thumbnail_columns = st.columns(min(len(recent_designs), 4))
+                for index, (design_id, design_clothing_type, thumbnail) in enumerate(recent_designs):
+                    with thumbnail_columns[index % len(thumbnail_columns)]:
+                        st.image(thumbnail, caption=f"#{design_id} {design_clothing_type}")
+
 if __name__ == "__main__":
     init_session_state() 
-    create_table()
-    display_design_studio()
-    load_models()
\ No newline at end of file
+    migrate()
+    start_workers()
+    display_design_studio()
\ No newline at end of file
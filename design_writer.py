@@ -0,0 +1,130 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+from database import get_pool, split_materials
+from design_images import store_design_image
+
+logger = logging.getLogger(__name__)
+
+# Designs are saved by one background thread that drains a queue and commits
+# whatever has accumulated in a single transaction (group commit), so
+# concurrent sessions share one fsync and one pass of the write lock instead
+# of serializing on it.
+WRITE_BATCH_SIZE = int(os.getenv("DESIGN_WRITE_BATCH_SIZE", "32"))
+WRITE_BATCH_WINDOW = float(os.getenv("DESIGN_WRITE_BATCH_WINDOW", "0.01"))  # seconds to gather a batch
+FLUSH_TIMEOUT = float(os.getenv("DESIGN_WRITE_FLUSH_TIMEOUT", "30"))  # seconds allowed at shutdown
+
+DESIGN_FIELDS = [
+    "user_id", "style", "materials", "clothing_type", "production_method", "packaging",
+    "production_location", "shipping_method", "base_color", "custom_design", "sustainability_score",
+]
+
+def insert_design(conn, record):
+    """Insert one design record (a dict of DESIGN_FIELDS plus optional image bytes) and its material rows; returns its id."""
+    image = record.get("image")
+    image_hash = store_design_image(conn, image) if image else None
+    cursor = conn.execute(
+        f"INSERT INTO designs ({', '.join(DESIGN_FIELDS)}, image_hash) VALUES ({', '.join('?' * (len(DESIGN_FIELDS) + 1))})",
+        [record.get(field) for field in DESIGN_FIELDS] + [image_hash]
+    )
+    if cursor.rowcount != 1 or not cursor.lastrowid:
+        raise RuntimeError("Design insert did not add a row")
+    conn.executemany("INSERT OR IGNORE INTO design_materials (design_id, material) VALUES (?, ?)",
+                     [(cursor.lastrowid, material) for material in split_materials(record.get("materials"))])
+    return cursor.lastrowid
+
+class DesignWriter:
+    """Write-behind queue for design records.
+
+    submit() returns a Future that resolves to the design id once the batch
+    holding the record has committed. A durable submit makes its batch commit
+    with synchronous=FULL, so the id is only returned after the WAL is synced
+    to disk; other batches use the pool's synchronous=NORMAL.
+    """
+
+    def __init__(self, db_path=None, batch_size=WRITE_BATCH_SIZE, batch_window=WRITE_BATCH_WINDOW):
+        self.pool = get_pool(db_path)
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="design-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, record, durable=False):
+        future = Future()
+        self._queue.put((record, durable, future))
+        return future
+
+    def flush(self, timeout=None):
+        """Block until everything submitted so far is committed (or failed). Returns False on timeout."""
+        done = threading.Event()
+        self._queue.put((None, False, done))
+        return done.wait(timeout)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get(timeout=self.batch_window))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            records = [item for item in batch if item[0] is not None]
+            if records:
+                self._write(records)
+            for record, _, marker in batch:
+                if record is None:
+                    marker.set()
+
+    def _write(self, records):
+        durable = any(item_durable for _, item_durable, _ in records)
+        try:
+            ids = self._commit(records, durable)
+        except Exception as e:
+            if len(records) == 1:
+                records[0][2].set_exception(e)
+                return
+            # Retry one by one so a single bad record doesn't fail the whole group
+            logger.warning(f"Group commit of {len(records)} designs failed ({e}); retrying individually")
+            for record in records:
+                self._write([record])
+            return
+        for (_, _, future), design_id in zip(records, ids):
+            future.set_result(design_id)
+
+    def _commit(self, records, durable):
+        conn = self.pool.acquire()
+        try:
+            if durable:
+                conn.execute("PRAGMA synchronous=FULL")
+            try:
+                with conn:
+                    return [insert_design(conn, record) for record, _, _ in records]
+            finally:
+                if durable:
+                    conn.execute("PRAGMA synchronous=NORMAL")
+        finally:
+            self.pool.release(conn)
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_design_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = DesignWriter()
+            atexit.register(_flush_at_exit)
+        return _writer
+
+def _flush_at_exit():
+    if _writer is not None and not _writer.flush(FLUSH_TIMEOUT):
+        logger.error("Design writer did not finish flushing before shutdown")
@@ -1,20 +1,68 @@
 import streamlit as st
-from PIL import Image #opening, manipulating and saving various image file formats
+from PIL import Image, ImageOps #opening, manipulating and saving various image file formats
 import torch
 import torchvision.transforms as transforms #resizing, cropping
 from torchvision.models import resnet50, ResNet50_Weights #dl model for img rec & classi
 import os
 from dotenv import load_dotenv #securely storing the sensitive info
-import google.generativeai as genai
 import io
+import hashlib
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from answer_prefetch import PREFETCH_ANSWERS, popular_questions, prefetch_answers, prefetched_answer, record_question
+from fabric_index import FABRIC_REUSE_THRESHOLD, get_fabric_index
+from gemini_client import STREAM_RESPONSES, generate_text, stream_text
+from model_registry import FAILED, registry as model_registry
 
 # Load environment variables
 load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY) #configures genai lib to use gemini api key
 
-@st.cache_resource
-def load_model():
+logger = logging.getLogger(__name__)
+
+FABRIC_BATCH_SIZE = int(os.getenv("FABRIC_BATCH_SIZE", "16")) #swatches per ResNet forward pass
+FABRIC_ANALYSIS_WORKERS = int(os.getenv("FABRIC_ANALYSIS_WORKERS", "4")) #concurrent Gemini analyses for multi-swatch uploads
+MODEL_INPUT_SIZE = 256 #shorter side fed to the model transform, before the 224 center crop
+PREVIEW_MAX_BYTES = int(os.getenv("FABRIC_PREVIEW_MAX_BYTES", str(1024 * 1024))) #smaller uploads are shown as-is
+PREVIEW_SIZE = 480 #longest side of the preview thumbnail for larger uploads
+
+#built once; the standard ImageNet preprocessing for ResNet50
+FABRIC_TRANSFORM = transforms.Compose([
+    transforms.Resize(MODEL_INPUT_SIZE),
+    transforms.CenterCrop(224),
+    transforms.ToTensor(), #scaled from 0-255 to 0.0-1.0. more stable & efficient training
+    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+]) #better model performance. these are the standard values calculated over the ImageNet dataset
+
+FabricUpload = namedtuple("FabricUpload", ["name", "image", "preview"])
+
+#per-upload results (predictions, analysis, index matches) keyed by a hash of the uploaded bytes,
+#so reruns triggered by the question widgets skip decoding, the model and the analysis call
+FABRIC_RESULT_CACHE_SIZE = int(os.getenv("FABRIC_RESULT_CACHE_SIZE", "32"))
+_upload_results = OrderedDict()
+_upload_results_lock = threading.Lock()
+
+def upload_key(data):
+    return hashlib.sha256(data).hexdigest()
+
+def get_upload_result(key):
+    with _upload_results_lock:
+        result = _upload_results.get(key)
+        if result is not None:
+            _upload_results.move_to_end(key)
+        return result
+
+def store_upload_result(key, result):
+    with _upload_results_lock:
+        _upload_results[key] = result
+        _upload_results.move_to_end(key)
+        while len(_upload_results) > FABRIC_RESULT_CACHE_SIZE:
+            _upload_results.popitem(last=False) #least recently used first
+
+def load_resnet():
     model = resnet50(weights=ResNet50_Weights.IMAGENET1K_V2) 
     #we want to use pre trained weights for imagenet classification
     #model is loaded with weights from a previous training on ImageNet, 
@@ -22,31 +70,76 @@ def load_model():
     model.eval()
     return model
 
+def warm_up_resnet(model):
+    with torch.no_grad(): #one dummy batch so the first real upload doesn't pay for kernel setup
+        model(torch.zeros(1, 3, 224, 224))
+
+model_registry.register("resnet50", load_resnet, warm_up_resnet)
+
+def load_model():
+    #returns None while the model is still loading in the background
+    return model_registry.get("resnet50")
+
+def load_fabric_image(data, name=""):
+    #decode an upload once, at roughly the size the model needs, and pick a cheap preview
+    image = Image.open(io.BytesIO(data))
+    if image.format == "JPEG":
+        #JPEG draft mode decodes at 1/2, 1/4 or 1/8 scale, keeping both sides >= the requested size
+        image.draft("RGB", (MODEL_INPUT_SIZE, MODEL_INPUT_SIZE))
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    factor = min(image.size) // MODEL_INPUT_SIZE
+    if factor >= 2: #formats without draft mode get a fast integer box reduction
+        image = image.reduce(factor)
+
+    if len(data) <= PREVIEW_MAX_BYTES:
+        preview = data
+    else:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((PREVIEW_SIZE, PREVIEW_SIZE))
+        preview_buf = io.BytesIO()
+        thumbnail.save(preview_buf, format='JPEG', quality=85)
+        preview = preview_buf.getvalue()
+    return FabricUpload(name, image, preview)
+
 def preprocess_image(image):
-    #chain multiple transformations together
-    transform = transforms.Compose([
-        transforms.Resize(256),
-        transforms.CenterCrop(224),
-        transforms.ToTensor(), #scaled from 0-255 to 0.0-1.0. more stable & efficient training
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-    ]) #better model performance. these are the standard values calculated over the ImageNet dataset
-    return transform(image).unsqueeze(0)
+    return FABRIC_TRANSFORM(image).unsqueeze(0)
 #PyTorch models often expect input data in batches, even if you're only processing a single image. 
 # Adding this dimension effectively creates a batch of size 1. 
 
-def analyze_image(model, image):
-    with torch.no_grad(): #when we are using the model for prediction not training
-        output = model(preprocess_image(image))
-        probabilities = torch.nn.functional.softmax(output[0], dim=0)#raw score to probabilities
-#might output predictions for a batch of images, even if you input only one. 
-# Selecting the first element extracts the predictions for your single image.
-    
-    top_prob, top_catid = torch.topk(probabilities, 5)
+def forward_with_features(model, batch):
+    #same as model(batch) but also returns the 2048-d pooled features that feed the final fc layer
+    x = model.maxpool(model.relu(model.bn1(model.conv1(batch))))
+    x = model.layer4(model.layer3(model.layer2(model.layer1(x))))
+    features = torch.flatten(model.avgpool(x), 1)
+    return model.fc(features), features
+
+def analyze_images_with_features(model, images, batch_size=FABRIC_BATCH_SIZE):
+    #top-5 predictions for every image plus an (N, 2048) feature matrix,
+    #running the model on stacked batches of batch_size images
     categories = ResNet50_Weights.IMAGENET1K_V2.meta["categories"]
-    
-    return [{"class": categories[top_catid[i]], "probability": top_prob[i].item()} for i in range(5)]
+    results = []
+    all_features = []
+    for start in range(0, len(images), batch_size):
+        batch = torch.cat([preprocess_image(image) for image in images[start:start + batch_size]])
+        with torch.no_grad(): #when we are using the model for prediction not training
+            logits, features = forward_with_features(model, batch)
+            probabilities = torch.nn.functional.softmax(logits, dim=1) #raw score to probabilities, per image
+        top_prob, top_catid = torch.topk(probabilities, 5, dim=1)
+        for probs, catids in zip(top_prob, top_catid):
+            results.append([{"class": categories[catid], "probability": prob.item()} for prob, catid in zip(probs, catids)])
+        all_features.append(features.numpy())
+    return results, np.concatenate(all_features)
+
+def analyze_images(model, images, batch_size=FABRIC_BATCH_SIZE):
+    return analyze_images_with_features(model, images, batch_size)[0]
 
-def get_fabric_analysis(image_description):
+def analyze_image(model, image):
+    return analyze_images(model, [image])[0]
+
+def describe_predictions(predictions):
+    return ", ".join([f"{pred['class']} ({pred['probability']:.2%})" for pred in predictions])
+
+def get_fabric_analysis(image_description, stream=False):
     prompt = f"""Based on this fabric description: {image_description}
     Provide a brief analysis of the fabric's composition and key properties:
     - Estimated composition (e.g., "70% Cotton, 30% Polyester")
@@ -55,11 +148,23 @@ def get_fabric_analysis(image_description):
     - Breathability
     Format as a short paragraph, focusing on the most likely characteristics."""
 
-    model = genai.GenerativeModel('gemini-1.5-flash')
-    response = model.generate_content(prompt)
-    return response.text
+    if stream:
+        return stream_text(prompt, 'gemini-1.5-flash')
+    return generate_text(prompt, 'gemini-1.5-flash')
+
+def _try_fabric_analysis(image_description):
+    try:
+        return get_fabric_analysis(image_description)
+    except Exception as e:
+        logger.warning(f"Fabric analysis failed: {e}")
+        return None
 
-def get_sustainability_answer(question, fabric_analysis):
+def get_fabric_analyses(image_descriptions, max_workers=FABRIC_ANALYSIS_WORKERS):
+    #fabric analyses for several swatches, requested concurrently; returned in input order, None where a request failed
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(image_descriptions)))) as executor:
+        return list(executor.map(_try_fabric_analysis, image_descriptions))
+
+def get_sustainability_answer(question, fabric_analysis, stream=False):
     prompt = f"""Given this fabric analysis: {fabric_analysis}
     
     Answer the following question about sustainable fashion:
@@ -67,9 +172,24 @@ def get_sustainability_answer(question, fabric_analysis):
     
     Provide a concise, practical answer focusing on sustainability and environmental impact."""
 
-    model = genai.GenerativeModel('gemini-1.5-flash')
-    response = model.generate_content(prompt)
-    return response.text
+    if stream:
+        return stream_text(prompt, 'gemini-1.5-flash')
+    return generate_text(prompt, 'gemini-1.5-flash')
+
+def display_similar_fabrics(matches):
+    #"similar fabrics we've seen" panel for one swatch's index matches
+    with st.expander(f"Similar fabrics we've seen ({len(matches)})"):
+        if not matches:
+            st.write("No fabrics analyzed yet.")
+        for similarity, record in matches:
+            thumb_col, text_col = st.columns([1, 4])
+            with thumb_col:
+                thumbnail = get_fabric_index().thumbnail(record)
+                if thumbnail:
+                    st.image(thumbnail)
+            with text_col:
+                st.markdown(f"**{record.get('name') or 'Fabric'}** — {similarity:.0%} similar")
+                st.caption(record['analysis'])
 
 def interactive_sustainable_fabric_advisor():
     st.markdown("""
@@ -266,30 +386,108 @@ def interactive_sustainable_fabric_advisor():
     st.write("Get fabric insights and personalized sustainability tips by uploading images—our Sustainable Fabric Advisor analyzes composition and properties for eco-friendly choices!")
     st.write("Upload a fabric image to get sustainability insights!")
 
-    uploaded_file = st.file_uploader("Choose a fabric image", type=["jpg", "png", "jpeg"])
+    uploaded_files = st.file_uploader("Choose fabric images", type=["jpg", "png", "jpeg"], accept_multiple_files=True)
     
-    if uploaded_file:
+    if uploaded_files:
         try:
-            # Load and convert image
-            image = Image.open(uploaded_file).convert('RGB')
-            
-            # Convert PIL Image to bytes for Streamlit
-            img_byte_arr = io.BytesIO()
-            image.save(img_byte_arr, format='PNG')
-            img_byte_arr = img_byte_arr.getvalue()
+            keys = [upload_key(uploaded_file.getvalue()) for uploaded_file in uploaded_files]
+            results = [get_upload_result(key) for key in keys]
+            pending = [index for index, result in enumerate(results) if result is None]
+
+            # Decode each new upload once, shared by the preview and the model
+            uploads = {index: load_fabric_image(uploaded_files[index].getvalue(), uploaded_files[index].name) for index in pending}
+            previews = [uploads[index].preview if index in uploads else result['preview'] for index, result in enumerate(results)]
+            names = [uploaded_file.name for uploaded_file in uploaded_files]
             
-            # Display image (removed use_container_width)
-            st.image(img_byte_arr, caption="Your Fabric")
+            if len(previews) == 1:
+                st.image(previews[0], caption="Your Fabric")
+            else:
+                st.image(previews, caption=names, width=160)
             
-            model = load_model()
-            
-            with st.spinner("Analyzing your fabric..."):
-                predictions = analyze_image(model, image)
-                image_description = ", ".join([f"{pred['class']} ({pred['probability']:.2%})" for pred in predictions])
-
-                fabric_analysis = get_fabric_analysis(image_description)
-                st.subheader("Fabric Analysis")
-                st.write(fabric_analysis)
+            streamed = False
+            if pending:
+                model = load_model()
+                if model is None:
+                    if model_registry.status("resnet50") == FAILED:
+                        st.error("The fabric recognition model could not be loaded. Please contact support.")
+                    else:
+                        st.info(f"The fabric recognition model is {model_registry.status('resnet50')}. Please try again in a moment.")
+                        st.button("Check again")
+                    return
+
+                with st.spinner("Analyzing your fabric..." if len(pending) == 1 else f"Analyzing {len(pending)} fabrics..."):
+                    all_predictions, features = analyze_images_with_features(model, [uploads[index].image for index in pending])
+                    fabric_index = get_fabric_index()
+                    all_matches = fabric_index.search(features)
+                for index, predictions, matches in zip(pending, all_predictions, all_matches):
+                    #a near-identical fabric was analyzed before: reuse its analysis instead of asking Gemini again
+                    reused = matches[0] if matches and matches[0][0] >= FABRIC_REUSE_THRESHOLD else None
+                    results[index] = {
+                        "name": names[index],
+                        "preview": uploads[index].preview,
+                        "predictions": predictions,
+                        "description": describe_predictions(predictions),
+                        "matches": matches,
+                        "reused": reused,
+                        "analysis": reused[1]['analysis'] if reused else None,
+                    }
+
+                new_swatches = [index for index in pending if results[index]['reused'] is None]
+                if len(results) == 1 and new_swatches:
+                    st.subheader("Fabric Analysis")
+                    with st.spinner("Analyzing your fabric..."):
+                        if STREAM_RESPONSES:
+                            results[0]['analysis'] = st.write_stream(get_fabric_analysis(results[0]['description'], stream=True))
+                            streamed = True
+                        else:
+                            results[0]['analysis'] = get_fabric_analysis(results[0]['description'])
+                elif new_swatches:
+                    with st.spinner(f"Analyzing {len(new_swatches)} fabrics..."):
+                        analyses = get_fabric_analyses([results[index]['description'] for index in new_swatches])
+                    for index, analysis in zip(new_swatches, analyses):
+                        results[index]['analysis'] = analysis
+                    failed = [results[index]['name'] for index, analysis in zip(new_swatches, analyses) if analysis is None]
+                    if failed:
+                        st.warning(f"Could not analyze {', '.join(failed)}. Try uploading them again.")
+
+                indexed = [index for index in new_swatches if results[index]['analysis']]
+                if indexed:
+                    fabric_index.add(
+                        features[[pending.index(index) for index in indexed]],
+                        [{"name": names[index], "description": results[index]['description'], "analysis": results[index]['analysis']} for index in indexed],
+                        [uploads[index].image for index in indexed]
+                    )
+                for index in pending:
+                    if results[index]['analysis']:
+                        store_upload_result(keys[index], results[index])
+
+            if len(results) == 1:
+                result = results[0]
+                if not streamed:
+                    st.subheader("Fabric Analysis")
+                    if result['reused']:
+                        st.caption(f"Reusing the analysis of a {result['reused'][0]:.0%} similar fabric we've seen before.")
+                    st.write(result['analysis'])
+                selected_swatch = 0
+            else:
+                st.subheader("Fabric Comparison")
+                st.dataframe(pd.DataFrame([
+                    {
+                        "Swatch": result['name'],
+                        "Top match": result['predictions'][0]["class"],
+                        "Confidence": f"{result['predictions'][0]['probability']:.1%}",
+                        "Other matches": ", ".join(pred["class"] for pred in result['predictions'][1:3]),
+                        "Analysis": result['analysis'],
+                        "Reused": result['reused'] is not None,
+                    }
+                    for result in results
+                ]), hide_index=True, use_container_width=True)
+
+                selected_swatch = st.selectbox("Ask questions about:", list(range(len(results))),
+                                               format_func=lambda index: results[index]['name'])
+
+            fabric_analysis = results[selected_swatch]['analysis']
+            display_similar_fabrics(results[selected_swatch]['matches'])
 
             # Predefined sustainability questions
             sustainability_questions = [
@@ -311,19 +509,37 @@ def interactive_sustainable_fabric_advisor():
             ]
 
             st.subheader("Explore Sustainability Options")
+            prefetch = st.checkbox("Prepare answers to popular questions in the background", value=PREFETCH_ANSWERS)
+            if prefetch and fabric_analysis:
+                prefetch_answers(get_sustainability_answer, fabric_analysis, popular_questions(sustainability_questions))
+
             selected_question = st.selectbox("Choose a sustainability question:", ["Select a question..."] + sustainability_questions)
 
             if selected_question != "Select a question...":
+                #count each choice once, not on every rerun while it stays selected
+                if st.session_state.get('last_fabric_question') != selected_question:
+                    record_question(selected_question)
+                st.session_state.last_fabric_question = selected_question
+
                 with st.spinner("Generating sustainability insights..."):
-                    answer = get_sustainability_answer(selected_question, fabric_analysis)
-                    st.write(answer)
+                    answer = prefetched_answer(fabric_analysis, selected_question)
+                    if answer:
+                        st.write(answer)
+                    elif STREAM_RESPONSES:
+                        st.write_stream(get_sustainability_answer(selected_question, fabric_analysis, stream=True))
+                    else:
+                        answer = get_sustainability_answer(selected_question, fabric_analysis)
+                        st.write(answer)
 
             st.subheader("Ask Your Own Question")
             custom_question = st.text_input("Type your sustainability question here:")
             if custom_question:
                 with st.spinner("Answering your question..."):
-                    custom_answer = get_sustainability_answer(custom_question, fabric_analysis)
-                    st.write(custom_answer)
+                    if STREAM_RESPONSES:
+                        st.write_stream(get_sustainability_answer(custom_question, fabric_analysis, stream=True))
+                    else:
+                        custom_answer = get_sustainability_answer(custom_question, fabric_analysis)
+                        st.write(custom_answer)
                     
         except Exception as e:
             st.error(f"Error processing image: {str(e)}")
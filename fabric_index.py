@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Persistent vector index of ResNet50 penultimate-layer features (2048-d) for
+# every analyzed fabric. Rows are L2-normalized, so a batch of cosine
+# similarities is one matrix product. A few thousand swatches fit easily in
+# memory; the matrix is saved as .npy next to a JSON file of records.
+FABRIC_INDEX_DIR = os.getenv("FABRIC_INDEX_DIR", "fabric_index")
+# Uploads at least this similar to an indexed fabric reuse its analysis
+FABRIC_REUSE_THRESHOLD = float(os.getenv("FABRIC_REUSE_THRESHOLD", "0.95"))
+FABRIC_SIMILAR_K = int(os.getenv("FABRIC_SIMILAR_K", "5"))
+THUMBNAIL_SIZE = 128
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+class FabricIndex:
+    """Fabric feature vectors with their analyses, searchable by cosine similarity."""
+
+    def __init__(self, directory=FABRIC_INDEX_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, "thumbnails"), exist_ok=True)
+        self._embeddings, self._records = self._load()
+
+    @property
+    def _embeddings_path(self):
+        return os.path.join(self.directory, "embeddings.npy")
+
+    @property
+    def _records_path(self):
+        return os.path.join(self.directory, "records.json")
+
+    def _load(self):
+        try:
+            embeddings = np.load(self._embeddings_path)
+            with open(self._records_path, encoding="utf-8") as f:
+                records = json.load(f)
+            if len(records) == len(embeddings):
+                return embeddings, records
+            logger.warning("Fabric index files are out of sync; starting a new index")
+        except (OSError, ValueError) as e:
+            logger.info(f"No fabric index loaded: {e}")
+        return np.zeros((0, 0), dtype=np.float32), []
+
+    def _save(self):
+        # Write to temporary files and rename, so a crash never leaves a half-written index
+        tmp_suffix = f".{uuid.uuid4().hex}.tmp"
+        with open(self._embeddings_path + tmp_suffix, "wb") as f:
+            np.save(f, self._embeddings)
+        with open(self._records_path + tmp_suffix, "w", encoding="utf-8") as f:
+            json.dump(self._records, f)
+        os.replace(self._embeddings_path + tmp_suffix, self._embeddings_path)
+        os.replace(self._records_path + tmp_suffix, self._records_path)
+
+    def __len__(self):
+        return len(self._records)
+
+    def search(self, queries, k=FABRIC_SIMILAR_K):
+        """Top-k matches for each query vector: a list per query of (similarity, record), best first."""
+        queries = normalize_rows(queries)
+        with self._lock:
+            embeddings, records = self._embeddings, self._records
+        if not records:
+            return [[] for _ in range(len(queries))]
+        similarities = queries @ embeddings.T
+        k = min(k, len(records))
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in zip(similarities, top):
+            ordered = candidates[np.argsort(-row[candidates])]
+            results.append([(float(row[index]), records[index]) for index in ordered])
+        return results
+
+    def add(self, vectors, records, thumbnails=None):
+        """Add fabrics; records are JSON-serializable dicts, thumbnails optional PIL images."""
+        vectors = normalize_rows(vectors)
+        thumbnails = thumbnails or [None] * len(records)
+        stored = []
+        for record, thumbnail in zip(records, thumbnails):
+            record = dict(record, id=uuid.uuid4().hex, added_at=time.time())
+            if thumbnail is not None:
+                record["thumbnail"] = self._save_thumbnail(record["id"], thumbnail)
+            stored.append(record)
+        with self._lock:
+            if self._embeddings.size:
+                self._embeddings = np.vstack([self._embeddings, vectors])
+            else:
+                self._embeddings = vectors
+            self._records = self._records + stored
+            self._save()
+        return stored
+
+    def _save_thumbnail(self, record_id, image):
+        thumbnail = image.copy()
+        thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        path = os.path.join(self.directory, "thumbnails", f"{record_id}.jpg")
+        thumbnail.save(path, format="JPEG", quality=80)
+        return path
+
+    def thumbnail(self, record):
+        path = record.get("thumbnail")
+        if not path:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_fabric_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = FabricIndex()
+        return _index
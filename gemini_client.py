@@ -0,0 +1,260 @@
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque, namedtuple
+
+import google.generativeai as genai
+from dotenv import load_dotenv
+from google.api_core import exceptions
+
+from response_cache import get_response_cache, make_cache_key
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Process-wide request budget shared by every page
+REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "60"))
+BURST_SIZE = int(os.getenv("GEMINI_BURST_SIZE", "10"))
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "4"))
+BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "1.0"))  # seconds
+BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "20.0"))  # longest single wait, in seconds
+CALL_DEADLINE = float(os.getenv("GEMINI_CALL_DEADLINE", "60.0"))  # total budget per call, in seconds
+# Pages render partial output as it arrives instead of waiting for the full response
+STREAM_RESPONSES = os.getenv("GEMINI_STREAM_RESPONSES", "1") == "1"
+
+RETRYABLE_ERRORS = (
+    exceptions.ResourceExhausted,
+    exceptions.TooManyRequests,
+    exceptions.ServiceUnavailable,
+    exceptions.InternalServerError,
+    exceptions.DeadlineExceeded,
+)
+
+CallStats = namedtuple("CallStats", ["model_name", "latency", "retries", "cached", "ok", "timestamp"])
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at rate_per_minute, holding at most capacity tokens."""
+
+    def __init__(self, rate_per_minute, capacity):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, timeout):
+        """Take one token, waiting at most timeout seconds. Returns False if none became available."""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+def retry_after_hint(error):
+    """Extract a server-suggested retry delay in seconds from an API error, if it carries one."""
+    for detail in getattr(error, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None:
+            return delay.seconds + delay.nanos / 1e9
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers and headers.get("Retry-After"):
+        try:
+            return float(headers["Retry-After"])
+        except ValueError:
+            pass
+    match = re.search(r"retry(?:_delay)?\s*(?:in|\{\s*seconds:)\s*([\d.]+)", str(error), re.IGNORECASE)
+    if match:
+        return float(match.group(1))
+    return None
+
+def chunk_text(chunk):
+    """Text of a streamed chunk, or an empty string for chunks without text parts."""
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
+
+def backoff_delay(attempt, hint=None):
+    """Full-jitter exponential backoff, never shorter than the server's retry-after hint."""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+    if hint is not None:
+        delay = max(delay, hint)
+    return delay
+
+class GeminiClient:
+    """Shared Gemini entry point: reuses model objects, rate-limits and retries every call."""
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, burst_size=BURST_SIZE):
+        self._models = {}
+        self._lock = threading.Lock()
+        self._configured = False
+        self.bucket = TokenBucket(requests_per_minute, burst_size)
+        self.call_stats = deque(maxlen=500)
+
+    def get_model(self, model_name):
+        with self._lock:
+            if not self._configured:
+                genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+                self._configured = True
+            model = self._models.get(model_name)
+            if model is None:
+                model = genai.GenerativeModel(model_name)
+                self._models[model_name] = model
+            return model
+
+    def _record(self, model_name, started, retries, cached, ok):
+        stats = CallStats(model_name, time.monotonic() - started, retries, cached, ok, time.time())
+        self.call_stats.append(stats)
+        logger.info(f"Gemini call model={model_name} latency={stats.latency:.2f}s retries={retries} cached={cached} ok={ok}")
+
+    def call_with_retry(self, model_name, request):
+        """Run request(model) under the rate limit, retrying transient errors within CALL_DEADLINE.
+
+        Returns (result, retries). Raises the last error once retries or the deadline run out.
+        """
+        model = self.get_model(model_name)
+        deadline = time.monotonic() + CALL_DEADLINE
+        attempt = 0
+        while True:
+            if not self.bucket.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                raise exceptions.ResourceExhausted("Local Gemini request budget exhausted")
+            try:
+                return request(model), attempt
+            except RETRYABLE_ERRORS as e:
+                delay = backoff_delay(attempt, retry_after_hint(e))
+                if attempt >= MAX_RETRIES or time.monotonic() + delay > deadline:
+                    raise
+                logger.warning(f"Gemini {type(e).__name__} on attempt {attempt + 1}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+
+    def generate(self, prompt, model_name, use_cache=True, generation_config=None):
+        """Return the response text for prompt, consulting the shared response cache first."""
+        started = time.monotonic()
+        cache = get_response_cache() if use_cache else None
+        cache_key = make_cache_key(model_name, prompt, generation_config)
+        if cache is not None:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                self._record(model_name, started, 0, True, True)
+                return cached
+
+        retries = 0
+        try:
+            response, retries = self.call_with_retry(model_name, lambda model: model.generate_content(prompt, generation_config=generation_config))
+            text = response.text
+        except Exception:
+            self._record(model_name, started, retries, False, False)
+            raise
+        self._record(model_name, started, retries, False, True)
+        if cache is not None:
+            cache.set(cache_key, text)
+        return text
+
+    def stream(self, prompt, model_name, use_cache=True):
+        """Yield response text chunks as they arrive; the completed text is cached at the end.
+
+        Transient errors are retried only until the first chunk arrives, since
+        partial output may already have been shown.
+        """
+        started = time.monotonic()
+        cache = get_response_cache() if use_cache else None
+        cache_key = make_cache_key(model_name, prompt)
+        if cache is not None:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                self._record(model_name, started, 0, True, True)
+                yield cached
+                return
+
+        def start(model):
+            chunks = iter(model.generate_content(prompt, stream=True))
+            return next(chunks, None), chunks
+
+        retries = 0
+        parts = []
+        try:
+            (first, chunks), retries = self.call_with_retry(model_name, start)
+            if first is not None:
+                for chunk in itertools.chain([first], chunks):
+                    text = chunk_text(chunk)
+                    if text:
+                        parts.append(text)
+                        yield text
+        except Exception:
+            self._record(model_name, started, retries, False, False)
+            raise
+        self._record(model_name, started, retries, False, True)
+        if cache is not None:
+            cache.set(cache_key, "".join(parts))
+
+    def stats_summary(self):
+        """Aggregate latency and retry counts over the recent calls."""
+        calls = list(self.call_stats)
+        remote = [c for c in calls if not c.cached]
+        return {
+            "calls": len(calls),
+            "cache_hits": len(calls) - len(remote),
+            "failures": sum(1 for c in calls if not c.ok),
+            "retries": sum(c.retries for c in calls),
+            "avg_latency": sum(c.latency for c in remote) / len(remote) if remote else 0.0,
+            "max_latency": max((c.latency for c in remote), default=0.0),
+        }
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GeminiClient()
+        return _client
+
+def generate_text(prompt, model_name='gemini-1.5-flash', use_cache=True):
+    return get_client().generate(prompt, model_name, use_cache=use_cache)
+
+def generate_json(prompt, response_schema, model_name='gemini-1.5-pro', validate=None, use_cache=True):
+    """Request a JSON response constrained to response_schema and return it parsed.
+
+    validate, if given, receives the parsed object and returns the value to
+    hand back, raising ValueError when the payload is unusable. Only
+    responses that parse and validate are cached.
+    """
+    generation_config = {"response_mime_type": "application/json", "response_schema": response_schema}
+    validate = validate or (lambda parsed: parsed)
+    cache = get_response_cache() if use_cache else None
+    cache_key = make_cache_key(model_name, prompt, generation_config)
+    cached = cache.get(cache_key) if cache is not None else None
+    if cached is not None:
+        try:
+            return validate(json.loads(cached))
+        except ValueError:
+            cache.delete(cache_key)
+
+    text = get_client().generate(prompt, model_name, use_cache=False, generation_config=generation_config)
+    result = validate(json.loads(text))
+    if cache is not None:
+        cache.set(cache_key, text)
+    return result
+
+def stream_text(prompt, model_name='gemini-1.5-flash', use_cache=True):
+    return get_client().stream(prompt, model_name, use_cache=use_cache)
@@ -0,0 +1,257 @@
+import atexit
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from database import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Image generation runs in worker processes that pull jobs from this SQLite
+# queue, so a slow run never blocks a Streamlit script thread and survives
+# the browser disconnecting.
+JOBS_DB_PATH = os.getenv("GENERATION_JOBS_DB", "generation_jobs.db")
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "1"))
+POLL_INTERVAL = float(os.getenv("GENERATION_POLL_INTERVAL", "0.5"))  # seconds
+STALE_JOB_SECONDS = float(os.getenv("GENERATION_STALE_JOB_SECONDS", "300"))
+JOB_RETENTION_SECONDS = float(os.getenv("GENERATION_JOB_RETENTION_SECONDS", str(24 * 3600)))
+WAIT_TIMEOUT = float(os.getenv("GENERATION_WAIT_TIMEOUT", "900"))  # seconds a page waits on one job
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+class JobCancelled(Exception):
+    pass
+
+def get_jobs_connection():
+    return get_connection(JOBS_DB_PATH)
+
+def init_jobs_db():
+    with get_jobs_connection() as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS generation_jobs
+                        (id TEXT PRIMARY KEY,
+                        status TEXT NOT NULL,
+                        params TEXT NOT NULL,
+                        step INTEGER DEFAULT 0,
+                        total_steps INTEGER DEFAULT 0,
+                        error TEXT,
+                        worker TEXT,
+                        preview BLOB,
+                        created_at REAL NOT NULL,
+                        updated_at REAL NOT NULL)''')
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(generation_jobs)')}
+        if 'preview' not in columns:
+            conn.execute('ALTER TABLE generation_jobs ADD COLUMN preview BLOB')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_generation_jobs_status ON generation_jobs(status, created_at)')
+        conn.execute('''CREATE TABLE IF NOT EXISTS generation_job_results
+                        (job_id TEXT NOT NULL,
+                        variant_index INTEGER NOT NULL,
+                        seed INTEGER NOT NULL,
+                        image BLOB NOT NULL,
+                        PRIMARY KEY (job_id, variant_index))''')
+
+def submit_job(params):
+    """Queue a generation job; params must be JSON-serializable. Returns the job ID."""
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    with get_jobs_connection() as conn:
+        conn.execute('INSERT INTO generation_jobs (id, status, params, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                     (job_id, QUEUED, json.dumps(params), now, now))
+    return job_id
+
+def get_job(job_id):
+    """Return the job as a dict (params decoded), or None if it does not exist."""
+    with get_jobs_connection() as conn:
+        row = conn.execute('SELECT * FROM generation_jobs WHERE id = ?', (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job['params'] = json.loads(job['params'])
+    job['progress'] = job['step'] / job['total_steps'] if job['total_steps'] else 0.0
+    return job
+
+def get_job_results(job_id):
+    """Return [(seed, png_bytes)] for a finished job, in variant order."""
+    with get_jobs_connection() as conn:
+        rows = conn.execute('SELECT seed, image FROM generation_job_results WHERE job_id = ? ORDER BY variant_index',
+                            (job_id,)).fetchall()
+    return [(row['seed'], row['image']) for row in rows]
+
+def claim_next_job(worker):
+    """Atomically move the oldest queued job to running and return it, or None if the queue is empty."""
+    now = time.time()
+    with get_jobs_connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute('SELECT id FROM generation_jobs WHERE status = ? ORDER BY created_at LIMIT 1', (QUEUED,)).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE generation_jobs SET status = ?, worker = ?, updated_at = ? WHERE id = ?',
+                     (RUNNING, worker, now, row['id']))
+    return get_job(row['id'])
+
+def update_progress(job_id, step, total_steps, preview=None):
+    """Record step progress (and a preview image, if given). Returns False once the job is no longer running."""
+    with get_jobs_connection() as conn:
+        if preview is None:
+            cursor = conn.execute('UPDATE generation_jobs SET step = ?, total_steps = ?, updated_at = ? WHERE id = ? AND status = ?',
+                                  (step, total_steps, time.time(), job_id, RUNNING))
+        else:
+            cursor = conn.execute('UPDATE generation_jobs SET step = ?, total_steps = ?, preview = ?, updated_at = ? WHERE id = ? AND status = ?',
+                                  (step, total_steps, preview, time.time(), job_id, RUNNING))
+        return cursor.rowcount > 0
+
+def complete_job(job_id, results):
+    with get_jobs_connection() as conn:
+        conn.executemany('INSERT OR REPLACE INTO generation_job_results (job_id, variant_index, seed, image) VALUES (?, ?, ?, ?)',
+                         [(job_id, index, seed, image) for index, (seed, image) in enumerate(results)])
+        conn.execute('UPDATE generation_jobs SET status = ?, step = total_steps, preview = NULL, updated_at = ? WHERE id = ? AND status = ?',
+                     (DONE, time.time(), job_id, RUNNING))
+
+def fail_job(job_id, error):
+    with get_jobs_connection() as conn:
+        conn.execute('UPDATE generation_jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?',
+                     (FAILED, str(error), time.time(), job_id))
+
+def cancel_job(job_id):
+    """Cancel a queued or running job; a running worker stops at its next denoising step."""
+    with get_jobs_connection() as conn:
+        conn.execute('UPDATE generation_jobs SET status = ?, preview = NULL, updated_at = ? WHERE id = ? AND status IN (?, ?)',
+                     (CANCELLED, time.time(), job_id, QUEUED, RUNNING))
+
+def requeue_stale_jobs():
+    """Put running jobs whose worker stopped reporting progress back on the queue."""
+    with get_jobs_connection() as conn:
+        cursor = conn.execute('UPDATE generation_jobs SET status = ?, worker = NULL WHERE status = ? AND updated_at < ?',
+                              (QUEUED, RUNNING, time.time() - STALE_JOB_SECONDS))
+        if cursor.rowcount:
+            logger.warning(f"Requeued {cursor.rowcount} stale generation jobs")
+
+def purge_old_jobs():
+    cutoff = time.time() - JOB_RETENTION_SECONDS
+    with get_jobs_connection() as conn:
+        conn.execute('''DELETE FROM generation_job_results WHERE job_id IN
+                        (SELECT id FROM generation_jobs WHERE status IN (?, ?, ?) AND updated_at < ?)''', (*FINISHED, cutoff))
+        conn.execute('DELETE FROM generation_jobs WHERE status IN (?, ?, ?) AND updated_at < ?', (*FINISHED, cutoff))
+
+def run_job(pipe, job):
+    from image_generation import generate_images, latents_to_preview, should_preview
+
+    params = job['params']
+
+    def on_step(step, total_steps, latents):
+        preview = None
+        if params.get('live_preview') and should_preview(step, total_steps):
+            preview = latents_to_preview(latents)
+        if not update_progress(job['id'], step, total_steps, preview):
+            raise JobCancelled(job['id'])
+
+    return generate_images(
+        pipe,
+        params['prompt'],
+        preset=params['preset'],
+        seed=params['seed'],
+        num_variants=params['num_variants'],
+        on_step=on_step
+    )
+
+def worker_main():
+    """Entry point of a generation worker process: load the pipeline once, then serve jobs until killed."""
+    from image_generation import load_stable_diffusion, warm_up_stable_diffusion
+
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    init_jobs_db()
+    pipe = load_stable_diffusion()
+    warm_up_stable_diffusion(pipe)
+    logger.info(f"Generation worker {worker} ready")
+
+    while True:
+        requeue_stale_jobs()
+        job = claim_next_job(worker)
+        if job is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+        logger.info(f"Worker {worker} running job {job['id']}")
+        try:
+            complete_job(job['id'], run_job(pipe, job))
+        except JobCancelled:
+            logger.info(f"Generation job {job['id']} cancelled")
+        except Exception as e:
+            logger.error(f"Generation job {job['id']} failed: {e}")
+            fail_job(job['id'], e)
+
+_workers = []
+_workers_started = False
+_workers_lock = threading.Lock()
+
+def _worker_env():
+    # Workers keep the server's working directory, so relative database and cache
+    # paths resolve to the same files; the module directory goes on PYTHONPATH instead
+    env = dict(os.environ)
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [module_dir, env.get("PYTHONPATH")]))
+    return env
+
+def start_workers(count=GENERATION_WORKERS):
+    """Keep count worker processes running, replacing any that have exited. Cheap to call on every rerun."""
+    global _workers_started
+    with _workers_lock:
+        if count <= 0:
+            return
+        exited = [process for process in _workers if process.poll() is not None]
+        for process in exited:
+            logger.warning(f"Generation worker {process.pid} exited with code {process.returncode}; restarting")
+            _workers.remove(process)
+        if len(_workers) >= count:
+            return
+        if not _workers_started:
+            init_jobs_db()
+            purge_old_jobs()
+            atexit.register(stop_workers)
+            _workers_started = True
+        # Workers run this module as their own entry point; starting them through
+        # multiprocessing would re-run the Streamlit script in every child
+        for _ in range(count - len(_workers)):
+            _workers.append(subprocess.Popen([sys.executable, "-m", "generation_jobs"], env=_worker_env()))
+
+def stop_workers():
+    with _workers_lock:
+        for process in _workers:
+            if process.poll() is None:
+                process.terminate()
+
+def workers_alive():
+    return sum(1 for process in _workers if process.poll() is None)
+
+def wait_for_job(job_id, on_update=None, timeout=WAIT_TIMEOUT):
+    """Poll a job until it finishes, calling on_update(job) on every poll. Returns the final job.
+
+    Fails the job if no worker process is left to run it. On timeout the job
+    is returned as it stands, still queued or running.
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    while True:
+        job = get_job(job_id)
+        if on_update is not None and job is not None:
+            on_update(job)
+        if job is None or job['status'] in FINISHED:
+            return job
+        if workers_alive() == 0:
+            fail_job(job_id, "No image generation worker is running")
+            return get_job(job_id)
+        if deadline is not None and time.monotonic() > deadline:
+            return job
+        time.sleep(POLL_INTERVAL)
+
+if __name__ == "__main__":
+    worker_main()
@@ -0,0 +1,174 @@
+import io
+import os
+
+import torch
+from diffusers import DPMSolverMultistepScheduler, StableDiffusionPipeline
+from PIL import Image
+
+from image_cache import get_image_cache, image_cache_key
+from memory_policy import apply_memory_policy, choose_memory_policy, decode_latents, install_adaptive_attention
+from prompt_embeddings import get_prompt_embedding_cache, popular_design_prompts, warm_prompt_embeddings
+from sd_quantization import SD_QUANTIZATION, quantize_pipeline
+
+# Stable Diffusion generation shared by the Design Studio page and the
+# out-of-process generation workers. Nothing here may import Streamlit.
+
+os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+os.environ['PYTORCH_ENABLE_MPS_FALLBACK'] = '1'
+
+SD_MODEL_ID = "runwayml/stable-diffusion-v1-5"
+DEFAULT_SEED = int(os.getenv("DEFAULT_GENERATION_SEED", "42"))
+MAX_VARIANTS = int(os.getenv("MAX_DESIGN_VARIANTS", "4"))
+
+# Image generation presets selectable in the Design Studio. "default" keeps the
+# pipeline's own PNDM scheduler; "dpm++" swaps in multistep DPM-Solver++, which
+# converges in far fewer steps.
+GENERATION_PRESETS = {
+    "Draft": {"scheduler": "dpm++", "num_inference_steps": 10, "guidance_scale": 6.0, "size": 384},
+    "Balanced": {"scheduler": "dpm++", "num_inference_steps": 15, "guidance_scale": 7.0, "size": 512},
+    "Quality": {"scheduler": "default", "num_inference_steps": 20, "guidance_scale": 7.0, "size": 512},
+}
+DEFAULT_GENERATION_PRESET = os.getenv("DEFAULT_GENERATION_PRESET", "Quality")
+
+# Live previews decode intermediate latents with a fixed linear projection of
+# the four SD 1.x latent channels onto RGB instead of running the VAE, which
+# costs a matrix multiply on a 64x64 grid.
+LIVE_PREVIEWS = os.getenv("LIVE_PREVIEWS", "1") == "1"
+PREVIEW_EVERY_STEPS = int(os.getenv("PREVIEW_EVERY_STEPS", "3"))
+PREVIEW_SIZE = int(os.getenv("PREVIEW_SIZE", "192"))
+LATENT_RGB_FACTORS = torch.tensor([
+    [0.3512, 0.2297, 0.3227],
+    [0.3250, 0.4974, 0.2350],
+    [-0.2829, 0.1762, 0.2721],
+    [-0.2120, -0.2616, -0.7177],
+])
+
+def build_design_prompt(style, clothing_type, base_color, materials, custom_design=""):
+    prompt = f"A sustainable {style.lower()} {clothing_type.lower()} in {base_color.lower()} color made from {', '.join(materials).lower()}. The primary color of the garment is {base_color.lower()}. Highly detailed fashion design with emphasis on eco-friendly features and ethical production. Show the garment in a natural, environmentally conscious setting."
+    if custom_design:
+        prompt += f" {custom_design}"
+    return prompt
+
+def model_variant(quantization=SD_QUANTIZATION):
+    """Model identity used in image cache keys; quantized weights produce different pixels."""
+    return SD_MODEL_ID if quantization == "none" else f"{SD_MODEL_ID}+{quantization}"
+
+def load_stable_diffusion(quantization=SD_QUANTIZATION):
+    pipe = StableDiffusionPipeline.from_pretrained(
+        SD_MODEL_ID,
+        torch_dtype=torch.float32,
+        safety_checker=None,
+        requires_safety_checker=False
+    )
+    pipe = pipe.to("cpu")
+    # Slicing and tiling are decided per request (see memory_policy), never toggled on the shared pipeline
+    install_adaptive_attention(pipe)
+    if quantization == "int8":
+        quantize_pipeline(pipe)
+    pipe.scheduler.num_inference_steps = 20
+    return pipe
+
+def warm_up_stable_diffusion(pipe, quantization=SD_QUANTIZATION):
+    # One tiny single-step run initializes the UNet, VAE and text encoder kernels
+    with torch.no_grad():
+        pipe(prompt="warm-up", num_inference_steps=1, height=128, width=128, guidance_scale=1.0)
+    warm_prompt_embeddings(pipe, model_variant(quantization), popular_design_prompts())
+
+def make_scheduler(pipe, scheduler_name):
+    if scheduler_name == "dpm++":
+        return DPMSolverMultistepScheduler.from_config(pipe.scheduler.config, algorithm_type="dpmsolver++", use_karras_sigmas=True)
+    return pipe.scheduler.__class__.from_config(pipe.scheduler.config)
+
+def pipeline_with_scheduler(pipe, scheduler_name):
+    """A per-request pipeline sharing the loaded models but owning a fresh scheduler.
+
+    Schedulers keep per-run state, so this also keeps concurrent sessions from
+    stepping on each other's timesteps.
+    """
+    components = dict(pipe.components)
+    components["scheduler"] = make_scheduler(pipe, scheduler_name)
+    components["requires_safety_checker"] = False
+    return StableDiffusionPipeline(**components)
+
+def latents_to_preview(latents, size=PREVIEW_SIZE):
+    """Approximate RGB preview of a batch of latents as PNG bytes, variants side by side."""
+    with torch.no_grad():
+        rgb = torch.einsum("bchw,cr->bhwr", latents.detach().float().cpu(), LATENT_RGB_FACTORS)
+        rgb = ((rgb + 1.0) * 127.5).clamp(0, 255).to(torch.uint8)
+    tiles = [Image.fromarray(tile.numpy()).resize((size, size), Image.BILINEAR) for tile in rgb]
+    strip = Image.new("RGB", (size * len(tiles), size))
+    for index, tile in enumerate(tiles):
+        strip.paste(tile, (index * size, 0))
+    image_buf = io.BytesIO()
+    strip.save(image_buf, format="PNG")
+    return image_buf.getvalue()
+
+def should_preview(step, total_steps, every=PREVIEW_EVERY_STEPS):
+    return every > 0 and step < total_steps and step % every == 0
+
+def generate_images(pipe, prompt, preset=DEFAULT_GENERATION_PRESET, seed=DEFAULT_SEED, num_variants=1, on_step=None):
+    """Generate num_variants PNG images seeded seed, seed + 1, ... in a single batched pipeline pass.
+
+    Variants already in the image cache are reused; only the rest are generated.
+    on_step(step, total_steps, latents) is called after every denoising step.
+    Returns a list of (seed, png_bytes) in seed order.
+    """
+    settings = GENERATION_PRESETS.get(preset, GENERATION_PRESETS["Quality"])
+    seeds = [seed + i for i in range(num_variants)]
+    cache = get_image_cache()
+    cache_keys = {
+        variant_seed: image_cache_key(
+            model_variant(), prompt, variant_seed, settings["num_inference_steps"], settings["guidance_scale"],
+            settings["size"], settings["size"], settings["scheduler"]
+        )
+        for variant_seed in seeds
+    }
+    images = {}
+    for variant_seed in seeds:
+        cached = cache.get(cache_keys[variant_seed])
+        if cached is not None:
+            images[variant_seed] = cached
+    missing = [variant_seed for variant_seed in seeds if variant_seed not in images]
+    if not missing:
+        return [(variant_seed, images[variant_seed]) for variant_seed in seeds]
+
+    total_steps = settings["num_inference_steps"]
+
+    def callback(step, timestep, latents):
+        if on_step is not None:
+            on_step(step + 1, total_steps, latents)
+
+    policy = choose_memory_policy(settings["size"], settings["size"], len(missing))
+    request_pipe = pipeline_with_scheduler(pipe, settings["scheduler"])
+
+    prompt_embeds, negative_prompt_embeds = get_prompt_embedding_cache().get(pipe, model_variant(), prompt)
+
+    with torch.no_grad(), apply_memory_policy(policy):
+        output = request_pipe(
+            prompt_embeds=prompt_embeds,
+            negative_prompt_embeds=negative_prompt_embeds,
+            num_inference_steps=total_steps,
+            guidance_scale=settings["guidance_scale"],
+            height=settings["size"],
+            width=settings["size"],
+            num_images_per_prompt=len(missing),
+            # One generator per image keeps each variant reproducible from its own seed
+            generator=[torch.Generator(device="cpu").manual_seed(variant_seed) for variant_seed in missing],
+            callback=callback,
+            callback_steps=1,
+            output_type="latent"
+        )
+        if len(output.images) != len(missing):
+            raise RuntimeError("Pipeline returned an unexpected number of images")
+        decoded = decode_latents(request_pipe.vae, output.images, policy)
+        pil_images = request_pipe.image_processor.postprocess(decoded, output_type="pil")
+
+    for variant_seed, image in zip(missing, pil_images):
+        image_buf = io.BytesIO()
+        image.save(image_buf, format="PNG")
+        images[variant_seed] = image_buf.getvalue()
+        # Tiled decoding blends overlapping tiles and differs from a plain decode; only
+        # plain decodes are cached so a cache hit never depends on memory at first generation
+        if not policy.vae_tiling:
+            cache.put(cache_keys[variant_seed], images[variant_seed])
+    return [(variant_seed, images[variant_seed]) for variant_seed in seeds]
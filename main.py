@@ -4,10 +4,9 @@ from design_studio import display_design_studio
 from sustainability_dashboard import display_sustainability_dashboard
 from sustainable_production_optimizer import display_sustainable_production_optimizer
 from sustainable_textile_generator import sustainable_textile_generator
-from sqlite3 import OperationalError
-from contextlib import contextmanager
-from queue import Queue
-import sqlite3
+from model_registry import registry as model_registry
+from generation_jobs import GENERATION_WORKERS, start_workers, workers_alive
+from database import migrate, pool_stats
 import os
 from PIL import Image
 from dotenv import load_dotenv
@@ -28,47 +27,15 @@ os.environ['KMP_DUPLICATE_LIB_OK']='TRUE'
 # Load environment variables
 load_dotenv()
 
-# Database connection pool
-DB_NAME = 'greenthreads.db'
-connection_pool = Queue(maxsize=5)
-
-@contextmanager
-def get_db_connection():
-    try:
-        connection = connection_pool.get(block=False)
-    except:
-        connection = sqlite3.connect(DB_NAME)
-    try:
-        yield connection
-    finally:
-        connection_pool.put(connection)
+# Start loading Stable Diffusion and ResNet50 in the background at server start
+model_registry.start()
+# Image generation worker processes (no-op when GENERATION_WORKERS=0)
+start_workers()
 
 # Initialize database
 def init_db():
-    with get_db_connection() as conn:
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS users
-                     (id INTEGER PRIMARY KEY, username TEXT UNIQUE, password TEXT)''')
-        
-        # Drop the existing designs table if it exists
-        c.execute('DROP TABLE IF EXISTS designs')
-        
-        # Create the designs table with all required columns
-        c.execute('''CREATE TABLE IF NOT EXISTS designs
-                     (id INTEGER PRIMARY KEY, 
-                      user_id INTEGER,
-                      style TEXT,
-                      materials TEXT,
-                      clothing_type TEXT,
-                      custom_design TEXT,
-                      timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                      recycling_instructions TEXT,
-                      production_method TEXT,
-                      packaging TEXT,
-                      shipping_method TEXT,
-                      base_color TEXT,
-                      sustainability_score REAL)''')
-        conn.commit()
+    # Applies any pending schema migrations; existing designs are kept
+    migrate()
 
 def sidebar_menu():
     with st.sidebar:
@@ -141,20 +108,19 @@ def sidebar_menu():
          #   st.query_params["page"] = "sustainability_dashboard"
           #  st.rerun()
 
-def display_design_studio_wrapper():
-    """Wrapper for design studio to handle model loading and database connection"""
-    if not st.session_state.get('models_loaded', False):
-        with st.spinner("Loading AI models..."):
-            try:
-                # Using the existing load_models function from design_studio
-                st.session_state.models_loaded = True
-            except Exception as e:
-                st.error(f"Error loading models: {str(e)}")
-                return
+        # Model readiness
+        for name, info in model_registry.statuses().items():
+            st.caption(f"{name}: {info['status']}")
+        if GENERATION_WORKERS > 0:
+            st.caption(f"image workers: {workers_alive()}/{GENERATION_WORKERS} running")
+        # Database pool pressure
+        for path, stats in pool_stats().items():
+            st.caption(f"{os.path.basename(path)}: {stats['open']} connections, "
+                       f"wait {stats['mean_wait_ms']:.1f}ms avg / {stats['max_wait_ms']:.0f}ms max")
 
-    # Maintain your existing database connection
-    with get_db_connection() as conn:
-        display_design_studio()
+def display_design_studio_wrapper():
+    """Wrapper for design studio; models load in the background registry and connections come from the database pool"""
+    display_design_studio()
 
 def display_home():
     st.markdown("""
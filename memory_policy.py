@@ -0,0 +1,161 @@
+import logging
+import os
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import torch
+import torch.nn.functional as F
+from diffusers.models.attention_processor import AttnProcessor, AttnProcessor2_0, SlicedAttnProcessor
+
+logger = logging.getLogger(__name__)
+
+# Memory knobs are chosen per generation from the memory actually available,
+# so large nodes run unsliced while small ones stay within their limit. The
+# shared pipeline is never mutated: attention slicing is switched through a
+# context variable read by one processor installed at load time, and VAE
+# tiling is chosen by how the caller decodes the latents.
+MEMORY_HEADROOM_BYTES = int(os.getenv("GENERATION_MEMORY_HEADROOM_BYTES", str(1024 * 1024 * 1024)))
+# Rough cost of decoding one output pixel with the SD 1.x VAE in float32
+VAE_BYTES_PER_PIXEL = int(os.getenv("VAE_BYTES_PER_PIXEL", "3072"))
+RSS_SAMPLE_INTERVAL = float(os.getenv("RSS_SAMPLE_INTERVAL", "0.05"))  # seconds
+
+class MemoryPolicy(namedtuple("MemoryPolicy", ["attention_slicing", "vae_slicing", "vae_tiling"])):
+    """attention_slicing is None, "auto" (half the heads per slice) or "max" (one head per slice)."""
+
+    def label(self):
+        vae = "tiled" if self.vae_tiling else "sliced" if self.vae_slicing else "batched"
+        return f"attention={self.attention_slicing or 'full'}, vae={vae}"
+
+UNSLICED = MemoryPolicy(attention_slicing=None, vae_slicing=False, vae_tiling=False)
+
+_attention_slicing = ContextVar("attention_slicing", default=None)
+
+class AdaptiveAttnProcessor:
+    """Attention processor that slices or not depending on the current request's policy."""
+
+    def __init__(self):
+        # The pipeline's own default: fused scaled_dot_product_attention where torch has it
+        self._full = AttnProcessor2_0() if hasattr(F, "scaled_dot_product_attention") else AttnProcessor()
+        self._sliced = {}
+
+    def _sliced_processor(self, slice_size):
+        if slice_size not in self._sliced:
+            self._sliced[slice_size] = SlicedAttnProcessor(slice_size)
+        return self._sliced[slice_size]
+
+    def __call__(self, attn, hidden_states, encoder_hidden_states=None, attention_mask=None, temb=None, **kwargs):
+        mode = _attention_slicing.get()
+        if mode is None:
+            return self._full(attn, hidden_states, encoder_hidden_states, attention_mask, temb, **kwargs)
+        slice_size = 1 if mode == "max" else max(1, attn.heads // 2)
+        return self._sliced_processor(slice_size)(attn, hidden_states, encoder_hidden_states, attention_mask)
+
+def install_adaptive_attention(pipe):
+    pipe.unet.set_attn_processor(AdaptiveAttnProcessor())
+
+def available_memory():
+    """Bytes this process can still allocate: MemAvailable, capped by a cgroup v2 limit if there is one."""
+    available = None
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        pass
+    if available is None:
+        try:
+            available = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        except (ValueError, OSError, AttributeError):
+            return None
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            limit = f.read().strip()
+        with open("/sys/fs/cgroup/memory.current") as f:
+            current = int(f.read().strip())
+        if limit != "max":
+            available = min(available, int(limit) - current)
+    except (OSError, ValueError):
+        pass
+    return available
+
+def attention_bytes(height, width, batch_size, heads=8):
+    """Peak size of the largest self-attention score matrix (64x64 latent tokens at 512px), with CFG doubling the batch."""
+    tokens = (height // 8) * (width // 8)
+    return 2 * batch_size * heads * tokens * tokens * 4
+
+def choose_memory_policy(height, width, batch_size, available=None):
+    if available is None:
+        available = available_memory()
+    if available is None:
+        return UNSLICED
+    budget = available - MEMORY_HEADROOM_BYTES
+
+    heads = 8
+    attention = attention_bytes(height, width, batch_size, heads)
+    # SlicedAttnProcessor holds slice_size of the 2 * batch_size * heads score matrices at a time
+    sliced_batches = 2 * batch_size * heads
+    if attention <= budget:
+        attention_slicing = None
+    elif attention * (heads // 2) / sliced_batches <= budget:
+        attention_slicing = "auto"
+    else:
+        attention_slicing = "max"
+
+    vae_per_image = VAE_BYTES_PER_PIXEL * height * width
+    vae_tiling = vae_per_image > budget
+    vae_slicing = not vae_tiling and batch_size > 1 and vae_per_image * batch_size > budget
+    return MemoryPolicy(attention_slicing, vae_slicing, vae_tiling)
+
+def decode_latents(vae, latents, policy):
+    """Decode latents to image tensors in [-1, 1] according to the policy's VAE settings."""
+    latents = latents / vae.config.scaling_factor
+    if policy.vae_tiling:
+        return vae.tiled_decode(latents, return_dict=False)[0]
+    if policy.vae_slicing:
+        return torch.cat([vae.decode(latent.unsqueeze(0), return_dict=False)[0] for latent in latents])
+    return vae.decode(latents, return_dict=False)[0]
+
+def current_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+_peak_rss = {}
+_peak_rss_lock = threading.Lock()
+
+@contextmanager
+def apply_memory_policy(policy):
+    """Activate a policy for the current thread and record the peak RSS while it is active."""
+    peak = [current_rss()]
+    stop = threading.Event()
+
+    def sample():
+        while not stop.wait(RSS_SAMPLE_INTERVAL):
+            peak[0] = max(peak[0], current_rss())
+
+    sampler = threading.Thread(target=sample, name="rss-sampler", daemon=True)
+    token = _attention_slicing.set(policy.attention_slicing)
+    sampler.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        sampler.join()
+        _attention_slicing.reset(token)
+        peak[0] = max(peak[0], current_rss())
+        label = policy.label()
+        with _peak_rss_lock:
+            _peak_rss[label] = max(_peak_rss.get(label, 0), peak[0])
+        logger.info(f"Generation with {label} peaked at {peak[0] / 2**20:.0f} MiB RSS")
+
+def peak_memory_by_policy():
+    """Highest RSS in bytes observed during a generation, per policy label."""
+    with _peak_rss_lock:
+        return dict(_peak_rss)
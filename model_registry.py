@@ -0,0 +1,96 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+LOADING = "loading"
+WARMING_UP = "warming up"
+READY = "ready"
+FAILED = "failed"
+
+class ModelRegistry:
+    """Loads registered models in background threads and keeps them resident for the process lifetime.
+
+    Each model gets a loader, which returns the model, and an optional warm-up,
+    which runs one throwaway inference so lazy kernel initialization happens
+    before the first user request. Pages call get(), which never blocks: it
+    returns None until the model is ready.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._status = {}
+        self._errors = {}
+        self._load_seconds = {}
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader, warmup=None):
+        with self._lock:
+            if name not in self._loaders:
+                self._loaders[name] = (loader, warmup)
+                self._status[name] = PENDING
+
+    def start(self, *names):
+        """Start background loading for the given models (all registered models by default)."""
+        with self._lock:
+            for name in names or list(self._loaders):
+                if name in self._threads or name not in self._loaders:
+                    continue
+                thread = threading.Thread(target=self._load, args=(name,), name=f"load-{name}", daemon=True)
+                self._threads[name] = thread
+                thread.start()
+
+    def _load(self, name):
+        loader, warmup = self._loaders[name]
+        started = time.monotonic()
+        try:
+            self._status[name] = LOADING
+            model = loader()
+            if warmup is not None:
+                self._status[name] = WARMING_UP
+                warmup(model)
+            with self._lock:
+                self._models[name] = model
+                self._load_seconds[name] = time.monotonic() - started
+                self._status[name] = READY
+            logger.info(f"Model {name} ready after {self._load_seconds[name]:.1f}s")
+        except Exception as e:
+            logger.error(f"Loading model {name} failed: {e}")
+            with self._lock:
+                self._errors[name] = str(e)
+                self._status[name] = FAILED
+
+    def get(self, name):
+        """Return the model if it is ready, otherwise None. Starts loading if nothing has yet."""
+        if name not in self._threads:
+            self.start(name)
+        return self._models.get(name)
+
+    def status(self, name):
+        return self._status.get(name, PENDING)
+
+    def error(self, name):
+        return self._errors.get(name)
+
+    def statuses(self):
+        """Readiness of every registered model, with load time for those that are ready."""
+        with self._lock:
+            return {
+                name: {"status": self._status[name], "load_seconds": self._load_seconds.get(name), "error": self._errors.get(name)}
+                for name in self._loaders
+            }
+
+    def wait(self, name, timeout=None):
+        """Block until the model has finished loading or failed; returns the model or None."""
+        self.start(name)
+        thread = self._threads.get(name)
+        if thread is not None:
+            thread.join(timeout)
+        return self._models.get(name)
+
+# Module-level so models survive Streamlit reruns and are shared by all sessions
+registry = ModelRegistry()
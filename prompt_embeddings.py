@@ -0,0 +1,76 @@
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import torch
+
+from database import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Design prompts come from a template over a handful of dropdowns, so the same
+# text is encoded over and over. Each entry holds the conditional and the
+# unconditional CLIP embeddings (2 x 77 x 768 float32, about 0.5 MB).
+PROMPT_EMBEDDING_CACHE_SIZE = int(os.getenv("PROMPT_EMBEDDING_CACHE_SIZE", "128"))
+PROMPT_EMBEDDING_WARMUP = int(os.getenv("PROMPT_EMBEDDING_WARMUP", "20"))
+
+class PromptEmbeddingCache:
+    """Bounded LRU of (prompt_embeds, negative_prompt_embeds) keyed by model and prompt text."""
+
+    def __init__(self, max_entries=PROMPT_EMBEDDING_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, pipe, model_id, prompt):
+        key = (model_id, prompt)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        with torch.no_grad():
+            embeddings = pipe.encode_prompt(prompt, pipe.device, num_images_per_prompt=1, do_classifier_free_guidance=True)
+        with self._lock:
+            self._entries[key] = embeddings
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return embeddings
+
+_cache = PromptEmbeddingCache()
+
+def get_prompt_embedding_cache():
+    return _cache
+
+def popular_design_prompts(limit=PROMPT_EMBEDDING_WARMUP):
+    """Prompts for the most frequently saved dropdown combinations, most popular first."""
+    from image_generation import build_design_prompt
+
+    try:
+        with get_connection() as conn:
+            rows = conn.execute('''SELECT style, clothing_type, base_color, materials, COUNT(*) AS uses
+                                   FROM designs
+                                   WHERE COALESCE(custom_design, '') = ''
+                                   GROUP BY style, clothing_type, base_color, materials
+                                   ORDER BY uses DESC
+                                   LIMIT ?''', (limit,)).fetchall()
+    except sqlite3.Error as e:
+        logger.info(f"No design history for prompt warm-up: {e}")
+        return []
+    return [
+        build_design_prompt(style, clothing_type, base_color, materials.split(', '))
+        for style, clothing_type, base_color, materials, _ in rows
+        if style and clothing_type and base_color and materials
+    ]
+
+def warm_prompt_embeddings(pipe, model_id, prompts):
+    for prompt in prompts:
+        _cache.get(pipe, model_id, prompt)
+    if prompts:
+        logger.info(f"Precomputed embeddings for {len(prompts)} design prompts")
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from database import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Shared on-disk cache for Gemini responses, used by every page and every
+# Streamlit worker process on the host.
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "llm_cache.db")
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Hits only refresh accessed_at once it is this old, so reads rarely take the write lock
+RESPONSE_CACHE_TOUCH_INTERVAL = float(os.getenv("RESPONSE_CACHE_TOUCH_INTERVAL", "300"))  # seconds
+# Expiry and size eviction run once per this many writes rather than scanning on each one
+RESPONSE_CACHE_EVICT_EVERY = int(os.getenv("RESPONSE_CACHE_EVICT_EVERY", "50"))
+
+def normalize_prompt(prompt):
+    """Collapse whitespace so indentation changes in prompt templates don't miss the cache."""
+    return " ".join(prompt.split())
+
+def make_cache_key(model_name, prompt, generation_config=None):
+    payload = normalize_prompt(prompt)
+    if generation_config:
+        # Responses to the same prompt differ by config (e.g. a JSON response schema)
+        payload += "\n" + json.dumps(generation_config, sort_keys=True, default=str)
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    return f"{model_name}:{digest}"
+
+class ResponseCacheBackend(ABC):
+    """Interface for response cache storage. Subclass to add e.g. a shared network cache."""
+
+    @abstractmethod
+    def get(self, key):
+        pass
+
+    @abstractmethod
+    def set(self, key, value):
+        pass
+
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+class SQLiteResponseCache(ResponseCacheBackend):
+    """SQLite-backed cache with a per-entry TTL and least-recently-used eviction by total size."""
+
+    def __init__(self, path=RESPONSE_CACHE_PATH, ttl=RESPONSE_CACHE_TTL, max_bytes=RESPONSE_CACHE_MAX_BYTES,
+                 touch_interval=RESPONSE_CACHE_TOUCH_INTERVAL, evict_every=RESPONSE_CACHE_EVICT_EVERY):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self.evict_every = max(1, evict_every)
+        self._lock = threading.Lock()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS responses
+                            (key TEXT PRIMARY KEY,
+                            value TEXT NOT NULL,
+                            size INTEGER NOT NULL,
+                            created_at REAL NOT NULL,
+                            accessed_at REAL NOT NULL)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_accessed_at ON responses(accessed_at)')
+
+    def _connect(self):
+        # Pooled, and each connection is held for one operation, so this is safe across threads
+        return get_connection(self.path)
+
+    def get(self, key):
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute('SELECT value, created_at, accessed_at FROM responses WHERE key = ?', (key,)).fetchone()
+                if row is None:
+                    return None
+                value, created_at, accessed_at = row
+                if self.ttl and now - created_at > self.ttl:
+                    conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                    return None
+                if now - accessed_at > self.touch_interval:
+                    conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+                return value
+        except sqlite3.Error as e:
+            logger.warning(f"Response cache read failed: {e}")
+            return None
+
+    def set(self, key, value):
+        if not value:
+            return
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        try:
+            with self._lock, self._connect() as conn:
+                conn.execute('''INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at)
+                                VALUES (?, ?, ?, ?, ?)''', (key, value, size, now, now))
+                self._writes += 1
+                if self._writes % self.evict_every == 0:
+                    self._evict(conn, now)
+        except sqlite3.Error as e:
+            logger.warning(f"Response cache write failed: {e}")
+
+    def _evict(self, conn, now):
+        if self.ttl:
+            conn.execute('DELETE FROM responses WHERE created_at < ?', (now - self.ttl,))
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        freed = 0
+        stale_keys = []
+        for key, size in conn.execute('SELECT key, size FROM responses ORDER BY accessed_at ASC'):
+            if total - freed <= self.max_bytes:
+                break
+            stale_keys.append((key,))
+            freed += size
+        conn.executemany('DELETE FROM responses WHERE key = ?', stale_keys)
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM responses')
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """Return the process-wide response cache, creating the default SQLite backend on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SQLiteResponseCache()
+        return _cache
+
+def set_response_cache(backend):
+    """Swap in a different ResponseCacheBackend implementation."""
+    global _cache
+    with _cache_lock:
+        _cache = backend
@@ -0,0 +1,146 @@
+import gc
+import io
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+from torch import nn
+
+from memory_policy import current_rss
+
+logger = logging.getLogger(__name__)
+
+# Opt-in dynamic int8 quantization of the Linear layers in the CLIP text
+# encoder and the UNet for CPU inference. Weights are stored as int8 and
+# activations are quantized on the fly, so no calibration data is needed.
+# Convolutions and the VAE stay in float32.
+SD_QUANTIZATION = os.getenv("SD_QUANTIZATION", "none")  # "none" or "int8"
+
+COMPARISON_PROMPTS = [
+    "A sustainable casual t-shirt in white color made from organic cotton. Highly detailed fashion design with emphasis on eco-friendly features and ethical production.",
+    "A sustainable formal blazer in navy blue color made from recycled wool, tencel. Highly detailed fashion design with emphasis on eco-friendly features and ethical production.",
+    "A sustainable bohemian dress in green color made from hemp, organic linen. Highly detailed fashion design with emphasis on eco-friendly features and ethical production.",
+]
+
+class DynamicInt8Linear(nn.Module):
+    """Dynamically quantized Linear that also accepts the LoRA scale argument diffusers passes to its Linear layers."""
+
+    def __init__(self, linear):
+        super().__init__()
+        plain = nn.Linear(linear.in_features, linear.out_features, bias=linear.bias is not None)
+        plain.weight = linear.weight
+        plain.bias = linear.bias
+        plain.qconfig = torch.ao.quantization.default_dynamic_qconfig
+        self.linear = torch.ao.nn.quantized.dynamic.Linear.from_float(plain)
+
+    def forward(self, hidden_states, scale=1.0):
+        return self.linear(hidden_states)
+
+def quantize_linear_layers(module):
+    """Replace every nn.Linear (including subclasses such as diffusers' LoRACompatibleLinear) in place. Returns the count."""
+    replaced = 0
+    for name, child in list(module.named_children()):
+        if isinstance(child, nn.Linear):
+            setattr(module, name, DynamicInt8Linear(child))
+            replaced += 1
+        else:
+            replaced += quantize_linear_layers(child)
+    return replaced
+
+def quantize_pipeline(pipe):
+    with torch.no_grad():
+        text_encoder_layers = quantize_linear_layers(pipe.text_encoder)
+        unet_layers = quantize_linear_layers(pipe.unet)
+    gc.collect()
+    logger.info(f"Quantized {text_encoder_layers} text encoder and {unet_layers} UNet linear layers to int8")
+    return pipe
+
+def weight_bytes(module):
+    """Serialized size of a module's weights, which counts packed int8 weights that parameters() does not."""
+    buffer = io.BytesIO()
+    torch.save(module.state_dict(), buffer)
+    return buffer.tell()
+
+def image_similarity(a, b):
+    """PSNR (dB) and global SSIM of two uint8 RGB arrays."""
+    a = a.astype(np.float64)
+    b = b.astype(np.float64)
+    mse = np.mean((a - b) ** 2)
+    psnr = float("inf") if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    a_gray, b_gray = a.mean(axis=2), b.mean(axis=2)
+    covariance = np.mean((a_gray - a_gray.mean()) * (b_gray - b_gray.mean()))
+    ssim = ((2 * a_gray.mean() * b_gray.mean() + c1) * (2 * covariance + c2)) / (
+        (a_gray.mean() ** 2 + b_gray.mean() ** 2 + c1) * (a_gray.var() + b_gray.var() + c2)
+    )
+    return psnr, float(ssim)
+
+def _run_prompts(pipe, prompts, steps, size, seed):
+    images, latencies = [], []
+    with torch.no_grad():
+        for prompt in prompts:
+            started = time.perf_counter()
+            output = pipe(
+                prompt=prompt,
+                num_inference_steps=steps,
+                height=size,
+                width=size,
+                generator=torch.Generator(device="cpu").manual_seed(seed),
+                output_type="np"
+            )
+            latencies.append(time.perf_counter() - started)
+            images.append((output.images[0] * 255).round().astype(np.uint8))
+    return images, latencies
+
+def _measure_mode(mode, prompts, steps, size, seed):
+    from image_generation import load_stable_diffusion, warm_up_stable_diffusion
+
+    rss_before = current_rss()
+    pipe = load_stable_diffusion(quantization=mode)
+    warm_up_stable_diffusion(pipe, quantization=mode)
+    images, latencies = _run_prompts(pipe, prompts, steps, size, seed)
+    return images, {
+        "mean_latency_seconds": sum(latencies) / len(latencies),
+        "latencies_seconds": latencies,
+        "weight_bytes": weight_bytes(pipe.text_encoder) + weight_bytes(pipe.unet),
+        "rss_increase_bytes": current_rss() - rss_before,
+    }
+
+def compare_quantization(prompts=COMPARISON_PROMPTS, steps=10, size=384, seed=42):
+    """Run the fixed prompt set on the float32 and int8 pipelines and report latency, memory and similarity.
+
+    Each mode runs in its own fresh process, so its RSS increase is not
+    measured on top of memory the other pipeline left behind.
+    """
+    results = {}
+    baseline_images = None
+    for mode in ("none", "int8"):
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            images, results[mode] = executor.submit(_measure_mode, mode, prompts, steps, size, seed).result()
+        if baseline_images is None:
+            baseline_images = images
+        else:
+            similarities = [image_similarity(a, b) for a, b in zip(baseline_images, images)]
+            results[mode]["psnr_db"] = [psnr for psnr, _ in similarities]
+            results[mode]["ssim"] = [ssim for _, ssim in similarities]
+
+    baseline, quantized = results["none"], results["int8"]
+    results["speedup"] = baseline["mean_latency_seconds"] / quantized["mean_latency_seconds"]
+    results["weight_ratio"] = quantized["weight_bytes"] / baseline["weight_bytes"]
+    return results
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    report = compare_quantization()
+    for mode in ("none", "int8"):
+        result = report[mode]
+        print(f"{mode:>5}: {result['mean_latency_seconds']:.1f}s per image, "
+              f"text encoder + UNet weights {result['weight_bytes'] / 2**20:.0f} MiB, "
+              f"RSS +{result['rss_increase_bytes'] / 2**20:.0f} MiB")
+    print(f"speedup {report['speedup']:.2f}x, weights {report['weight_ratio']:.0%} of float32")
+    for prompt_index, (psnr, ssim) in enumerate(zip(report["int8"]["psnr_db"], report["int8"]["ssim"])):
+        print(f"prompt {prompt_index + 1}: PSNR {psnr:.1f} dB, SSIM {ssim:.3f}")
@@ -4,44 +4,62 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
-import sqlite3
-
-# Database connection function
-def get_db_connection():
-    """Create and return a database connection with row factory."""
-    try:
-        conn = sqlite3.connect('greenthreads.db', detect_types=sqlite3.PARSE_DECLTYPES)
-        conn.row_factory = sqlite3.Row
-        print("Database connection successful")
-        return conn
-    except sqlite3.Error as e:
-        print(f"Database connection error: {str(e)}")
-        return None
+from database import get_connection
 
 def display_sustainability_dashboard():
     st.title("Sustainability Analytics Dashboard")
     
     # Get data from database
-    conn = get_db_connection()
-    if not conn:
-        st.error("Could not connect to database")
-        return
-        
     try:
-        # Fetch all designs
-        query = """
+        with get_connection() as conn:
+            all_materials = [row['material'] for row in conn.execute("SELECT DISTINCT material FROM design_materials ORDER BY material")]
+        selected_materials = st.multiselect("Filter by material", all_materials)
+
+        # Designs using any of the selected materials; every aggregation below applies the same filter
+        if selected_materials:
+            material_match = f"SELECT design_id FROM design_materials WHERE material IN ({', '.join('?' * len(selected_materials))})"
+            design_filter = f"WHERE id IN ({material_match})"
+            material_filter = f"WHERE design_id IN ({material_match})"
+        else:
+            design_filter = material_filter = ""
+
+        # Monthly aggregates
+        query = f"""
         SELECT 
             strftime('%Y-%m', timestamp) as month,
             AVG(sustainability_score) as avg_score,
-            COUNT(*) as design_count,
-            materials,
-            production_method,
-            clothing_type
+            COUNT(*) as design_count
         FROM designs 
+        {design_filter}
         GROUP BY strftime('%Y-%m', timestamp)
         ORDER BY month DESC
         """
-        df = pd.read_sql_query(query, conn)
+        materials_query = f"""
+        SELECT material AS Material, COUNT(*) AS Count
+        FROM design_materials
+        {material_filter}
+        GROUP BY material
+        ORDER BY Count DESC
+        """
+        production_query = f"""
+        SELECT production_method AS Method, COUNT(*) AS Count
+        FROM designs
+        {design_filter}
+        GROUP BY production_method
+        ORDER BY Count DESC
+        """
+        clothing_query = f"""
+        SELECT clothing_type AS Type, COUNT(*) AS Count
+        FROM designs
+        {design_filter}
+        GROUP BY clothing_type
+        ORDER BY Count DESC
+        """
+        with get_connection() as conn:
+            df = pd.read_sql_query(query, conn, params=selected_materials)
+            materials_df = pd.read_sql_query(materials_query, conn, params=selected_materials)
+            production_df = pd.read_sql_query(production_query, conn, params=selected_materials)
+            clothing_df = pd.read_sql_query(clothing_query, conn, params=selected_materials)
         
         if df.empty:
             st.warning("No data available in the database. Generate some designs first!")
@@ -99,13 +117,6 @@ def display_sustainability_dashboard():
         with col1:
             # Material Usage
             st.subheader("Material Distribution")
-            materials_df = pd.DataFrame([
-                item.strip() 
-                for sublist in df['materials'].str.split(',') 
-                for item in sublist
-            ]).value_counts().reset_index()
-            materials_df.columns = ['Material', 'Count']
-            
             fig_materials = px.pie(
                 materials_df,
                 values='Count',
@@ -119,9 +130,6 @@ def display_sustainability_dashboard():
         with col2:
             # Production Methods
             st.subheader("Production Methods")
-            production_df = df['production_method'].value_counts().reset_index()
-            production_df.columns = ['Method', 'Count']
-            
             fig_production = px.bar(
                 production_df,
                 x='Method',
@@ -139,9 +147,6 @@ def display_sustainability_dashboard():
         
         # Clothing Types
         st.subheader("Popular Clothing Types")
-        clothing_df = df['clothing_type'].value_counts().reset_index()
-        clothing_df.columns = ['Type', 'Count']
-        
         fig_clothing = px.bar(
             clothing_df,
             x='Type',
@@ -160,8 +165,6 @@ def display_sustainability_dashboard():
         
     except Exception as e:
         st.error(f"Error fetching data: {str(e)}")
-    finally:
-        conn.close()
 
 # Add some custom styling
 st.markdown("""
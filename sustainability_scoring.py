@@ -0,0 +1,106 @@
+"""Deterministic sustainability scoring for Design Studio designs.
+
+Each material, production method and packaging option offered in the Design
+Studio has impact factors on a 0-100 scale, where higher is better. The
+overall score combines them as follows:
+
+    material score   = weighted mean of a material's criteria (MATERIAL_CRITERIA_WEIGHTS),
+                       averaged over the selected materials
+    production score = weighted mean of a method's criteria (PRODUCTION_CRITERIA_WEIGHTS)
+    packaging score  = the packaging option's factor
+    overall          = sum of component scores weighted by COMPONENT_WEIGHTS
+
+Options not in the tables, such as free-text "Other" entries, get
+DEFAULT_FACTOR on every criterion. Bump IMPACT_FACTORS_VERSION whenever
+a table or weight changes, so stored scores can be traced back to the
+tables that produced them.
+"""
+
+IMPACT_FACTORS_VERSION = "1.0"
+
+DEFAULT_FACTOR = 50
+
+COMPONENT_WEIGHTS = {"materials": 0.5, "production": 0.3, "packaging": 0.2}
+
+MATERIAL_CRITERIA_WEIGHTS = {"water": 0.25, "carbon": 0.30, "chemicals": 0.20, "end_of_life": 0.25}
+
+# water, carbon, chemicals, end_of_life
+MATERIAL_FACTORS = {
+    "Organic Cotton": {"water": 40, "carbon": 65, "chemicals": 85, "end_of_life": 85},
+    "Recycled Polyester": {"water": 85, "carbon": 60, "chemicals": 55, "end_of_life": 35},
+    "Hemp": {"water": 90, "carbon": 85, "chemicals": 85, "end_of_life": 90},
+    "Tencel": {"water": 80, "carbon": 75, "chemicals": 75, "end_of_life": 85},
+    "Bamboo": {"water": 75, "carbon": 70, "chemicals": 45, "end_of_life": 75},
+    "Cork": {"water": 90, "carbon": 90, "chemicals": 80, "end_of_life": 85},
+    "Recycled Nylon": {"water": 80, "carbon": 60, "chemicals": 50, "end_of_life": 35},
+    "Piñatex": {"water": 85, "carbon": 75, "chemicals": 65, "end_of_life": 60},
+    "Econyl": {"water": 80, "carbon": 65, "chemicals": 55, "end_of_life": 45},
+    "Recycled Wool": {"water": 85, "carbon": 75, "chemicals": 70, "end_of_life": 80},
+    "Organic Linen": {"water": 85, "carbon": 80, "chemicals": 85, "end_of_life": 90},
+    "Soy Fabric": {"water": 65, "carbon": 65, "chemicals": 55, "end_of_life": 80},
+    "Qmilk": {"water": 75, "carbon": 70, "chemicals": 80, "end_of_life": 85},
+    "Orange Fiber": {"water": 85, "carbon": 75, "chemicals": 65, "end_of_life": 80},
+    "Recycled Denim": {"water": 90, "carbon": 80, "chemicals": 70, "end_of_life": 70},
+}
+
+PRODUCTION_CRITERIA_WEIGHTS = {"waste": 0.6, "energy": 0.4}
+
+PRODUCTION_FACTORS = {
+    "Cut-and-Sew": {"waste": 40, "energy": 60},
+    "Fully Fashioned Knitting": {"waste": 85, "energy": 60},
+    "Seamless Knitting": {"waste": 90, "energy": 55},
+    "3D Printing": {"waste": 85, "energy": 35},
+    "Zero Waste Pattern Cutting": {"waste": 95, "energy": 65},
+    "Upcycling": {"waste": 95, "energy": 80},
+}
+
+PACKAGING_FACTORS = {
+    "Recycled Cardboard": 75,
+    "Compostable Mailers": 80,
+    "Reusable Fabric Bags": 85,
+    "Minimal Packaging": 90,
+    "Plastic-free Packaging": 75,
+}
+
+def _weighted(factors, weights):
+    return sum(factors.get(criterion, DEFAULT_FACTOR) * weight for criterion, weight in weights.items())
+
+def material_score(material):
+    factors = MATERIAL_FACTORS.get(material, {})
+    return _weighted(factors, MATERIAL_CRITERIA_WEIGHTS)
+
+def production_score(production_method):
+    factors = PRODUCTION_FACTORS.get(production_method, {})
+    return _weighted(factors, PRODUCTION_CRITERIA_WEIGHTS)
+
+def packaging_score(packaging):
+    return PACKAGING_FACTORS.get(packaging, DEFAULT_FACTOR)
+
+def score_design(materials, production_method, packaging):
+    """Score a design from the impact tables; returns the overall score and its components."""
+    materials = [m for m in materials if m] or [None]
+    components = {
+        "materials": sum(material_score(m) for m in materials) / len(materials),
+        "production": production_score(production_method),
+        "packaging": packaging_score(packaging),
+    }
+    overall = sum(components[name] * weight for name, weight in COMPONENT_WEIGHTS.items())
+    return {
+        "score": int(round(overall)),
+        "components": {name: int(round(value)) for name, value in components.items()},
+        "version": IMPACT_FACTORS_VERSION,
+    }
+
+def explain_score(result, materials, production_method, packaging):
+    """Plain-text explanation of a score_design() result."""
+    components = result["components"]
+    return (
+        f"Materials ({', '.join(m for m in materials if m)}) score {components['materials']}/100 "
+        f"on water use, carbon, chemical use and end-of-life. "
+        f"{production_method} scores {components['production']}/100 on fabric waste and energy use. "
+        f"{packaging} scores {components['packaging']}/100. "
+        f"Weighted {int(COMPONENT_WEIGHTS['materials'] * 100)}% materials, "
+        f"{int(COMPONENT_WEIGHTS['production'] * 100)}% production and "
+        f"{int(COMPONENT_WEIGHTS['packaging'] * 100)}% packaging "
+        f"(impact factors v{result['version']})."
+    )
@@ -1,10 +1,9 @@
 import streamlit as st
-import google.generativeai as genai
 from dotenv import load_dotenv
 import os
-import time
 from google.api_core.exceptions import NotFound, ResourceExhausted
 import logging
+from gemini_client import STREAM_RESPONSES, generate_text, stream_text
 
 # Set up logging to file for private debugging
 logging.basicConfig(
@@ -24,9 +23,7 @@ if not GEMINI_API_KEY:
     st.error("Application configuration error. Please contact support.")
     st.stop()
 
-genai.configure(api_key=GEMINI_API_KEY)
-
-def get_sustainable_recommendations(production_details):
+def get_sustainable_recommendations(production_details, stream=False):
     prompt = f"""
     For a fashion item with these production details:
     {production_details}
@@ -48,33 +45,26 @@ def get_sustainable_recommendations(production_details):
     Tailor recommendations to the location, regulations, and climate. Highlight **key recommendations** in bold. Include environmental benefits and estimated cost implications where possible. Keep concise and actionable.
     """
 
-    model = genai.GenerativeModel('gemini-1.5-flash')
-    max_retries = 3
-    retry_delay = 5
+    if stream:
+        # Errors surface while the caller iterates the chunks
+        return stream_text(prompt, 'gemini-1.5-flash')
 
-    for attempt in range(max_retries):
-        try:
-            response = model.generate_content(prompt)
-            logger.info("Successfully generated sustainability recommendations.")
-            return response.text
-        except NotFound as e:
-            logger.error(f"Model not found error: {e}")
-            st.error("Unable to generate recommendations due to a configuration issue. Please contact support.")
-            return None
-        except ResourceExhausted as e:
-            logger.warning(f"ResourceExhausted error on attempt {attempt + 1}: {e}")
-            if attempt < max_retries - 1:
-                logger.info(f"Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-                retry_delay *= 2
-            else:
-                logger.error("Max retries reached for ResourceExhausted error.")
-                st.error("Unable to generate recommendations due to a temporary issue. Please try again later or contact support.")
-                return None
-        except Exception as e:
-            logger.error(f"Unexpected error: {e}")
-            st.error("An unexpected issue occurred. Please try again later or contact support.")
-            return None
+    try:
+        recommendations = generate_text(prompt, 'gemini-1.5-flash')
+        logger.info("Successfully generated sustainability recommendations.")
+        return recommendations
+    except NotFound as e:
+        logger.error(f"Model not found error: {e}")
+        st.error("Unable to generate recommendations due to a configuration issue. Please contact support.")
+        return None
+    except ResourceExhausted as e:
+        logger.error(f"ResourceExhausted error after retries: {e}")
+        st.error("Unable to generate recommendations due to a temporary issue. Please try again later or contact support.")
+        return None
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        st.error("An unexpected issue occurred. Please try again later or contact support.")
+        return None
 
 def display_sustainable_production_optimizer():
     st.markdown("""
@@ -248,7 +238,6 @@ def display_sustainable_production_optimizer():
          "Environmental Clean-up Events", "Open Factory Days", "Sponsorship of Local Events", "None"]
     )
 
-    # Cache results to avoid redundant API calls
     production_details = f"""
     Production Location: {location}
     Climate Zone: {climate_zone}
@@ -267,28 +256,26 @@ def display_sustainable_production_optimizer():
     Technology Used: {', '.join(technology_usage)}
     Community Engagement: {', '.join(community_engagement)}
     """
-    cache_key = production_details
-    if "recommendations_cache" not in st.session_state:
-        st.session_state.recommendations_cache = {}
 
     if st.button("Get Sustainability Recommendations"):
         if not location or not energy_source or not water_source or not materials:
             st.warning("Please complete all required fields (Location, Energy Sources, Water Sources, Materials).")
         else:
             with st.spinner("Analyzing and generating recommendations..."):
-                if cache_key in st.session_state.recommendations_cache:
-                    recommendations = st.session_state.recommendations_cache[cache_key]
-                    logger.info("Retrieved recommendations from cache.")
+                # Results are served from the shared response cache when available
+                if STREAM_RESPONSES:
+                    try:
+                        st.write_stream(get_sustainable_recommendations(production_details, stream=True))
+                    except Exception as e:
+                        logger.error(f"Streaming recommendations failed: {e}")
+                        st.error("Unable to generate recommendations at this time. Please try again later or contact support.")
                 else:
                     recommendations = get_sustainable_recommendations(production_details)
-                    if recommendations:
-                        st.session_state.recommendations_cache[cache_key] = recommendations
-                        logger.info("Generated new recommendations and cached them.")
 
-                if recommendations:
-                    st.markdown(recommendations)
-                else:
-                    st.error("Unable to generate recommendations at this time. Please try again later or contact support.")
+                    if recommendations:
+                        st.markdown(recommendations)
+                    else:
+                        st.error("Unable to generate recommendations at this time. Please try again later or contact support.")
 
 if __name__ == "__main__":
     display_sustainable_production_optimizer()
\ No newline at end of file
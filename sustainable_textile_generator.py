@@ -1,10 +1,9 @@
 import streamlit as st
-import google.generativeai as genai
 import os
 from dotenv import load_dotenv
-import time
 from google.api_core.exceptions import ResourceExhausted
 import logging
+from gemini_client import STREAM_RESPONSES, generate_text, stream_text
 
 # Set up logging to file for private debugging
 logging.basicConfig(
@@ -25,9 +24,7 @@ if not GEMINI_API_KEY:
     st.error("Application configuration error. Please contact support.")
     st.stop()
 
-genai.configure(api_key=GEMINI_API_KEY)
-
-def generate_innovative_textile(base_material, desired_properties, sustainability_goals, additional_requirements, production_method, target_market):
+def generate_innovative_textile(base_material, desired_properties, sustainability_goals, additional_requirements, production_method, target_market, stream=False):
     # Simplified prompt to reduce token usage
     prompt = f"""Generate a unique, sustainable textile with:
     Base Material: {base_material}
@@ -55,27 +52,20 @@ def generate_innovative_textile(base_material, desired_properties, sustainabilit
 
     Keep the response concise and innovative."""
 
-    model = genai.GenerativeModel('gemini-1.5-flash')  # Use lighter model if available
-    max_retries = 3
-    retry_delay = 5  # seconds
-
-    for attempt in range(max_retries):
-        try:
-            response = model.generate_content(prompt)
-            logger.info("Successfully generated textile description.")
-            return response.text
-        except ResourceExhausted as e:
-            logger.warning(f"ResourceExhausted error on attempt {attempt + 1}: {e}")
-            if attempt < max_retries - 1:
-                logger.info(f"Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-                retry_delay *= 2  # Exponential backoff
-            else:
-                logger.error("Max retries reached for ResourceExhausted error.")
-                return None
-        except Exception as e:
-            logger.error(f"Unexpected error: {e}")
-            return None
+    if stream:
+        # Errors surface while the caller iterates the chunks
+        return stream_text(prompt, 'gemini-1.5-flash')
+
+    try:
+        textile_description = generate_text(prompt, 'gemini-1.5-flash')  # Use lighter model if available
+        logger.info("Successfully generated textile description.")
+        return textile_description
+    except ResourceExhausted as e:
+        logger.error(f"ResourceExhausted error after retries: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        return None
 
 def sustainable_textile_generator():
     st.markdown("""
@@ -175,29 +165,26 @@ def sustainable_textile_generator():
 
     additional_requirements = st.text_area("Additional requirements or challenges:")
 
-    # Cache results to avoid redundant API calls
-    cache_key = f"{base_material}_{'_'.join(sorted(desired_properties))}_{'_'.join(sorted(sustainability_goals))}_{additional_requirements}_{production_method}_{target_market}"
-    if "textile_result" not in st.session_state:
-        st.session_state.textile_result = {}
-
     if st.button("Generate Innovative Textile"):
         if not all([base_material, desired_properties, sustainability_goals, production_method, target_market]):
             st.warning("Please complete all required fields.")
         else:
             with st.spinner("Generating your innovative, sustainable textile..."):
-                # Check cache first
-                if cache_key in st.session_state.textile_result:
-                    textile_description = st.session_state.textile_result[cache_key]
-                    logger.info("Retrieved result from cache.")
+                # Results are served from the shared response cache when available
+                if STREAM_RESPONSES:
+                    st.write("### Your Innovative Sustainable Textile")
+                    try:
+                        textile_description = st.write_stream(generate_innovative_textile(base_material, desired_properties, sustainability_goals, additional_requirements, production_method, target_market, stream=True))
+                    except Exception as e:
+                        logger.error(f"Streaming textile description failed: {e}")
+                        textile_description = None
                 else:
                     textile_description = generate_innovative_textile(base_material, desired_properties, sustainability_goals, additional_requirements, production_method, target_market)
                     if textile_description:
-                        st.session_state.textile_result[cache_key] = textile_description
-                        logger.info("Generated new textile description and cached it.")
+                        st.write("### Your Innovative Sustainable Textile")
+                        st.write(textile_description)
 
                 if textile_description:
-                    st.write("### Your Innovative Sustainable Textile")
-                    st.write(textile_description)
                     st.markdown("""
                     ### Next Steps:
                     1. Review the creation guide above.
@@ -0,0 +1,156 @@
+import sqlite3
+import threading
+
+import pytest
+
+import database
+from database import MIGRATIONS, migrate, schema_version
+from design_writer import DesignWriter
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "greenthreads.db")
+
+def test_migrate_fresh_database_is_idempotent(db_path):
+    assert migrate(db_path) == LATEST_VERSION
+    assert migrate(db_path) == LATEST_VERSION
+    conn = sqlite3.connect(db_path)
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {"users", "designs", "question_popularity", "design_images", "design_materials"} <= tables
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'designs'")}
+    assert {"idx_designs_month_score", "idx_designs_user_timestamp"} <= indexes
+    assert not {"idx_designs_timestamp", "idx_designs_score"} & indexes
+    assert schema_version(conn) == LATEST_VERSION
+
+def test_migrate_backfills_old_designs(db_path):
+    # The table design_studio.create_table used to make, without the later columns
+    conn = sqlite3.connect(db_path)
+    conn.execute('''CREATE TABLE designs (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, materials TEXT,
+                    design_image BLOB, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+    conn.executemany("INSERT INTO designs (user_id, materials, design_image) VALUES (?, ?, ?)", [
+        ("a", "Hemp, Organic Cotton", b"image-1"),
+        ("a", "Hemp, , Hemp", b"image-1"),
+        ("b", None, None),
+    ])
+    conn.commit()
+    conn.close()
+
+    assert migrate(db_path) == LATEST_VERSION
+
+    conn = sqlite3.connect(db_path)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(designs)")}
+    assert {name for name, _ in database.DESIGNS_COLUMNS} | {"image_hash"} <= columns
+    assert conn.execute("SELECT design_id, material FROM design_materials ORDER BY design_id, material").fetchall() == [
+        (1, "Hemp"), (1, "Organic Cotton"), (2, "Hemp"),
+    ]
+    # Identical inline images are moved once into the blob table
+    assert conn.execute("SELECT COUNT(*) FROM design_images").fetchone()[0] == 1
+    assert conn.execute("SELECT COUNT(*) FROM designs WHERE design_image IS NOT NULL").fetchone()[0] == 0
+    hashes = [row[0] for row in conn.execute("SELECT image_hash FROM designs ORDER BY id")]
+    assert hashes[0] == hashes[1] and hashes[2] is None
+
+def test_monthly_aggregation_uses_covering_index(db_path):
+    migrate(db_path)
+    conn = sqlite3.connect(db_path)
+    plan = conn.execute('''EXPLAIN QUERY PLAN
+                           SELECT strftime('%Y-%m', timestamp) AS month, AVG(sustainability_score), COUNT(*)
+                           FROM designs GROUP BY strftime('%Y-%m', timestamp) ORDER BY month DESC''').fetchall()
+    assert any("COVERING INDEX idx_designs_month_score" in row[3] for row in plan)
+
+def test_recent_designs_use_user_index(db_path):
+    migrate(db_path)
+    conn = sqlite3.connect(db_path)
+    plan = conn.execute('''EXPLAIN QUERY PLAN
+                           SELECT id, clothing_type, image_hash FROM designs
+                           WHERE user_id = ? AND image_hash IS NOT NULL
+                           ORDER BY timestamp DESC, id DESC LIMIT 5''', ("user",)).fetchall()
+    assert any("idx_designs_user_timestamp" in row[3] for row in plan)
+
+def test_split_materials():
+    assert database.split_materials(" Hemp,Cork , ,Hemp") == ["Hemp", "Cork"]
+    assert database.split_materials(None) == []
+
+def test_pool_overflow_and_timeout(db_path):
+    pool = database.ConnectionPool(db_path, size=1, max_overflow=1, timeout=0.1)
+    first = pool.acquire()
+    overflow = pool.acquire()
+    with pytest.raises(database.PoolTimeout):
+        pool.acquire()
+    stats = pool.stats()
+    assert stats["open"] == 2 and stats["overflow_opened"] == 1 and stats["timeouts"] == 1
+
+    # Beyond size, released connections are closed rather than kept idle
+    pool.release(overflow)
+    pool.release(first)
+    stats = pool.stats()
+    assert stats["open"] == 1 and stats["idle"] == 1
+
+def test_pool_waiter_gets_released_connection(db_path):
+    pool = database.ConnectionPool(db_path, size=1, max_overflow=0, timeout=5)
+    held = pool.acquire()
+    timer = threading.Timer(0.1, pool.release, (held,))
+    timer.start()
+    conn = pool.acquire()
+    timer.join()
+    assert conn is held
+    stats = pool.stats()
+    assert stats["waited"] == 1 and stats["max_wait_ms"] > 0
+    pool.release(conn)
+
+def test_pool_connection_rolls_back_on_error(db_path):
+    pool = database.ConnectionPool(db_path, size=1, max_overflow=0)
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            conn.execute("INSERT INTO t VALUES (1)")
+            raise RuntimeError("boom")
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+def _design(**fields):
+    record = {"user_id": "user", "style": "Casual", "materials": "Hemp, Cork", "sustainability_score": 80}
+    record.update(fields)
+    return record
+
+def test_writer_group_commit_isolates_bad_record(db_path):
+    migrate(db_path)
+    writer = DesignWriter(db_path, batch_window=0.5)
+    futures = [writer.submit(_design()), writer.submit(_design(style=object())), writer.submit(_design(materials="Wool"))]
+    first_id = futures[0].result(timeout=5)
+    with pytest.raises(sqlite3.Error):
+        futures[1].result(timeout=5)
+    third_id = futures[2].result(timeout=5)
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM designs").fetchone()[0] == 2
+    assert conn.execute("SELECT material FROM design_materials WHERE design_id = ? ORDER BY material", (first_id,)).fetchall() == [("Cork",), ("Hemp",)]
+    assert conn.execute("SELECT material FROM design_materials WHERE design_id = ?", (third_id,)).fetchall() == [("Wool",)]
+
+def test_writer_concurrent_submits_and_flush(db_path):
+    migrate(db_path)
+    writer = DesignWriter(db_path)
+    futures = []
+    futures_lock = threading.Lock()
+
+    def submit_many():
+        for index in range(25):
+            future = writer.submit(_design(), durable=index % 10 == 0)
+            with futures_lock:
+                futures.append(future)
+
+    threads = [threading.Thread(target=submit_many) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert writer.flush(timeout=10)
+    # Everything submitted before flush() has been written by the time it returns
+    assert all(future.done() for future in futures)
+    assert len({future.result() for future in futures}) == 100
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM designs").fetchone()[0] == 100
+    assert conn.execute("SELECT COUNT(*) FROM design_materials").fetchone()[0] == 200